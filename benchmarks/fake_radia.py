@@ -0,0 +1,134 @@
+"""Stand-in for radia that generates synthetic results at any scale
+
+Only what RadiaGeomMgr calls is provided. Results are returned as python
+lists, like radia, so conversion costs are realistic, but nothing is solved:
+Fld is a cheap function of position and Solve returns at once.
+
+    import fake_radia  # from this directory
+    fake_radia.install(sides=16)
+    from jupyter_rs_radia import radia_tk
+"""
+
+import math
+import numpy
+import sys
+
+# polygon sides of the cross section of each element, which has sides + 2 faces
+_config = dict(sides=4)
+_objs = {}
+
+
+class _Obj:
+    def __init__(self, center=None, size=None, mag=None, members=None):
+        self.center = center
+        self.members = members
+        self.mag = mag
+        self.size = size
+
+
+def install(sides=4):
+    """Makes "import radia" import this module
+
+    Args:
+        sides (int): sides of the cross section of each element
+    """
+    _config["sides"] = sides
+    sys.modules["radia"] = sys.modules[__name__]
+
+
+def Fld(g, f_type, points):
+    p = numpy.reshape(points, (-1, 3))
+    r = numpy.linalg.norm(p, axis=1)[:, numpy.newaxis] + 1.0
+    f = numpy.stack((p[:, 1], -p[:, 0], numpy.ones(len(p))), axis=1) / r**2
+    # like radia, one point gives one vector, not a list of them
+    return f[0].tolist() if len(p) == 1 else f.ravel().tolist()
+
+
+def ObjCnt(members):
+    return _add(_Obj(members=list(members)))
+
+
+def ObjCntStuf(g):
+    return list(_objs[g].members or [])
+
+
+def ObjDrwVTK(g, opt=""):
+    # a prism per element, with the cross section inscribed in its x-y size
+    c = numpy.array([_objs[e].center for e in _leaves(g)], dtype=float)
+    s = numpy.array([_objs[e].size for e in _leaves(g)], dtype=float)
+    n = _config["sides"]
+    a = numpy.arange(n) * (2 * math.pi / n)
+    ring = numpy.stack((numpy.cos(a), numpy.sin(a)), axis=1) / 2
+    lo = numpy.empty((len(c), n, 3))
+    lo[..., :2] = c[:, numpy.newaxis, :2] + ring * s[:, numpy.newaxis, :2]
+    lo[..., 2] = (c[:, 2] - s[:, 2] / 2)[:, numpy.newaxis]
+    hi = lo.copy()
+    hi[..., 2] += s[:, 2:3]
+    j = (numpy.arange(n) + 1) % n
+    v = numpy.concatenate(
+        (
+            lo[:, ::-1].reshape(len(c), -1),
+            hi.reshape(len(c), -1),
+            numpy.stack((lo, lo[:, j], hi[:, j], hi), axis=2).reshape(len(c), -1),
+        ),
+        axis=1,
+    ).ravel()
+    l = ([n, n] + [4] * n) * len(c)
+    colors = [0.0, 0.5, 1.0] * len(l)
+    return {
+        "polygons": {"colors": colors, "lengths": l, "vertices": v.tolist()},
+        "lines": {"colors": list(colors), "lengths": list(l), "vertices": v.tolist()},
+    }
+
+
+def ObjGeoLim(g):
+    c = numpy.array([_objs[e].center for e in _leaves(g)])
+    s = numpy.array([_objs[e].size for e in _leaves(g)])
+    return (
+        numpy.stack(((c - s / 2).min(axis=0), (c + s / 2).max(axis=0)), axis=1)
+        .ravel()
+        .tolist()
+    )
+
+
+def ObjM(g):
+    return [[_objs[e].center, _objs[e].mag] for e in _leaves(g)]
+
+
+def ObjRecMag(center, size, mag):
+    return _add(_Obj(center=list(center), size=list(size), mag=list(mag)))
+
+
+def ObjSetM(g, mag):
+    _objs[g].mag = list(mag)
+
+
+def RlxAuto(intrc, prec, max_iter, method=0, opt=""):
+    return [prec, 1.0, 1.0, float(max_iter)]
+
+
+def RlxPre(g, src=0):
+    # the interaction matrix
+    return _add(_Obj())
+
+
+def Solve(g, prec, max_iter, method=0):
+    return [prec, 1.0, 1.0, float(max_iter)]
+
+
+def UtiDel(g):
+    _objs.pop(g, None)
+
+
+def _add(o):
+    # ids are not reused after UtiDel
+    k = max(_objs, default=0) + 1
+    _objs[k] = o
+    return k
+
+
+def _leaves(g):
+    m = _objs[g].members
+    if m is None:
+        return [g]
+    return [e for x in m for e in _leaves(x)]
@@ -0,0 +1,54 @@
+"""Speedup of RadiaGeomMgr.get_field_parallel vs. number of processes
+
+Requires radia. Evaluates B on an n x n x n grid around a solved iron
+dipole and prints the time per process count.
+
+    python benchmarks/field_pool.py [n] [max_workers]
+"""
+
+from jupyter_rs_radia import radia_tk
+import numpy
+import os
+import radia
+import sys
+import time
+
+
+def _dipole():
+    iron = radia.MatSatIsoFrm([20000, 2], [0.1, 2], [0.1, 2])
+    pole = radia.ObjRecMag([0, 0, 30], [60, 60, 40], [0, 0, 0])
+    radia.ObjDivMag(pole, [6, 6, 4])
+    radia.MatApl(pole, iron)
+    magnet = radia.ObjRecMag([0, 0, 80], [60, 60, 40], [0, 0, 1])
+    g = radia.ObjCnt([pole, magnet])
+    radia.TrfZerPara(g, [0, 0, 0], [0, 0, 1])
+    return g
+
+
+def main(n=60, max_workers=None):
+    # without a field cache, so every call evaluates the field
+    mgr = radia_tk.RadiaGeomMgr(field_cache_bytes=0)
+    mgr.add_geom("dipole", _dipole())
+    mgr.solve("dipole", 0.0001, 1500, 0)
+    a = numpy.linspace(-25, 25, n)
+    path = numpy.stack(numpy.meshgrid(a, a, a, indexing="ij"), axis=-1).ravel()
+    t = time.perf_counter()
+    ref = mgr.get_field_array("dipole", "B", path.tolist())
+    t1 = time.perf_counter() - t
+    print("{:>8} {:>10} {:>8}".format("workers", "seconds", "speedup"))
+    print("{:>8} {:>10.3f} {:>8.2f}".format(1, t1, 1.0))
+    w = 2
+    while w <= (max_workers or os.cpu_count()):
+        # the first call starts the processes and restores the geometry
+        mgr.get_field_parallel("dipole", "B", path[: 3 * w], num_workers=w)
+        t = time.perf_counter()
+        res = mgr.get_field_parallel("dipole", "B", path, num_workers=w)
+        d = time.perf_counter() - t
+        assert numpy.allclose(res, ref)
+        print("{:>8} {:>10.3f} {:>8.2f}".format(w, d, t1 / d))
+        w *= 2
+    mgr.close_field_pool()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
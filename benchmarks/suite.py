@@ -0,0 +1,224 @@
+"""Time, peak memory and payload size of each stage of the rendering pipeline
+
+Runs against fake_radia (synthetic geometry and fields) unless --real-radia
+is given. Results can be saved as a JSON baseline and compared with a later
+run, which exits with status 1 if any stage is slower than --tolerance times
+the baseline.
+
+    python benchmarks/suite.py --scale medium --save baseline.json
+    python benchmarks/suite.py --scale medium --compare baseline.json
+"""
+
+import argparse
+import datetime
+import json
+import numpy
+import platform
+import sys
+import time
+import tracemalloc
+
+# elements in the geometry and field points per scale
+SCALES = dict(
+    small=dict(elements=100, points=10000),
+    medium=dict(elements=2000, points=200000),
+    large=dict(elements=20000, points=2000000),
+)
+
+STAGES = [
+    "to_pkdict",
+    "vtk_to_data",
+    "geom_to_data",
+    "geom_to_data_cached",
+    "get_field",
+    "vector_field_to_data",
+    "serialize_binary",
+    "serialize_json",
+]
+
+# stages whose output is what is sent to the browser
+PAYLOAD_STAGES = set(STAGES[2:4] + STAGES[5:])
+
+
+def main():
+    p = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    p.add_argument("--scale", choices=SCALES, default="small")
+    p.add_argument("--sides", type=int, default=4, help="sides of each element")
+    p.add_argument("--repeat", type=int, default=3, help="runs per stage")
+    p.add_argument("--real-radia", action="store_true")
+    p.add_argument("--save", help="write results to this JSON file")
+    p.add_argument("--compare", help="JSON file of an earlier run")
+    p.add_argument("--tolerance", type=float, default=1.25)
+    a = p.parse_args()
+    if not a.real_radia:
+        import fake_radia
+
+        fake_radia.install(sides=a.sides)
+    r = run(a.scale, a.repeat)
+    r.meta.update(radia="real" if a.real_radia else "fake", sides=a.sides)
+    b = None
+    if a.compare:
+        with open(a.compare) as f:
+            b = json.load(f)
+    print(_report(r, b))
+    if a.save:
+        with open(a.save, "w") as f:
+            json.dump(r, f, indent=2, sort_keys=True)
+    if b is not None and _regressions(r, b, a.tolerance):
+        sys.exit(1)
+
+
+def run(scale, repeat=3):
+    """Runs every stage
+
+    Args:
+        scale (str): key of SCALES
+        repeat (int): runs per stage; the fastest is reported
+    Returns:
+        PKDict: meta (run description) and stages (seconds, peak_bytes and
+        payload_bytes of each)
+    """
+    from jupyter_rs_radia import gui_utils
+    from jupyter_rs_radia import radia_tk
+    from pykern.pkcollections import PKDict
+    import radia
+
+    s = SCALES[scale]
+    n = int(round(s["elements"] ** (1 / 3)))
+    g = radia.ObjCnt(
+        [
+            radia.ObjRecMag([i, j, k], [1, 1, 1], [0, 0, 1])
+            for i in range(n)
+            for j in range(n)
+            for k in range(s["elements"] // n**2)
+        ]
+    )
+    mgr = radia_tk.RadiaGeomMgr()
+    mgr.add_geom("g", g)
+    pts = numpy.random.default_rng(0).uniform(-n, 2 * n, (s["points"], 3))
+    vtk = radia.ObjDrwVTK(g, "Axes->No")
+
+    def _geom_cold():
+        mgr.invalidate("g")
+        return mgr.geom_to_data("g")
+
+    def _field():
+        mgr.invalidate("g")
+        return mgr.get_field_array("g", "B", pts)
+
+    geom = mgr.geom_to_data("g")
+    field = mgr.get_field_array("g", "B", pts)
+    fns = PKDict(
+        to_pkdict=lambda: radia_tk.to_pkdict(vtk),
+        vtk_to_data=lambda: radia_tk.vtk_to_data(vtk),
+        geom_to_data=_geom_cold,
+        geom_to_data_cached=lambda: mgr.geom_to_data("g"),
+        get_field=_field,
+        vector_field_to_data=lambda: mgr.vector_field_to_data("g", field, "T"),
+        serialize_binary=lambda: gui_utils.to_binary(geom),
+        serialize_json=lambda: json.dumps(gui_utils.to_lists(geom)).encode(),
+    )
+    res = PKDict(
+        meta=PKDict(
+            date=datetime.datetime.now().isoformat(timespec="seconds"),
+            elements=len(radia.ObjCntStuf(g)),
+            numpy=numpy.__version__,
+            points=s["points"],
+            python=platform.python_version(),
+            scale=scale,
+        ),
+        stages=PKDict(),
+    )
+    for k in STAGES:
+        res.stages[k] = _measure(fns[k], repeat, k in PAYLOAD_STAGES)
+    return res
+
+
+def _measure(fn, repeat, payload):
+    t = []
+    for _ in range(repeat):
+        s = time.perf_counter()
+        fn()
+        t.append(time.perf_counter() - s)
+    tracemalloc.start()
+    try:
+        r = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return dict(
+        seconds=min(t),
+        peak_bytes=peak,
+        payload_bytes=_payload_bytes(r) if payload else None,
+    )
+
+
+def _payload_bytes(data):
+    # binary buffers plus the JSON of everything else, as sent to the browser
+    b = []
+
+    def _strip(d):
+        if isinstance(d, memoryview):
+            b.append(d.nbytes)
+            return None
+        if isinstance(d, numpy.ndarray):
+            b.append(d.nbytes)
+            return None
+        if isinstance(d, dict):
+            return {k: _strip(v) for k, v in d.items()}
+        if isinstance(d, (list, tuple)):
+            return [_strip(v) for v in d]
+        return d
+
+    if isinstance(data, bytes):
+        return len(data)
+    return len(json.dumps(_strip(data))) + sum(b)
+
+
+def _regressions(run, baseline, tolerance):
+    return [
+        k
+        for k, v in run["stages"].items()
+        if k in baseline["stages"]
+        and v["seconds"] > tolerance * baseline["stages"][k]["seconds"]
+    ]
+
+
+def _report(run, baseline=None):
+    m = run["meta"]
+    r = [
+        "{} radia, {} elements, {} points".format(
+            m["radia"], m["elements"], m["points"]
+        ),
+        "{:<22} {:>10} {:>10} {:>12}{}".format(
+            "stage",
+            "seconds",
+            "peak MB",
+            "payload MB",
+            "" if baseline is None else "  vs. baseline",
+        ),
+    ]
+    for k, v in run["stages"].items():
+        c = ""
+        if baseline is not None and k in baseline["stages"]:
+            c = "  {:.2f}x".format(
+                v["seconds"] / max(baseline["stages"][k]["seconds"], 1e-9)
+            )
+        r.append(
+            "{:<22} {:>10.4f} {:>10.1f} {:>12}{}".format(
+                k,
+                v["seconds"],
+                v["peak_bytes"] / 1e6,
+                (
+                    ""
+                    if v["payload_bytes"] is None
+                    else "{:.1f}".format(v["payload_bytes"] / 1e6)
+                ),
+                c,
+            )
+        )
+    return "\n".join(r)
+
+
+if __name__ == "__main__":
+    main()
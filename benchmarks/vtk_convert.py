@@ -0,0 +1,76 @@
+"""Cost of converting radia.ObjDrwVTK output and encoding it for the viewer:
+radia_tk.vtk_to_data vs. to_pkdict
+
+Builds ObjDrwVTK-shaped data for n quadrilaterals (as lists of python
+numbers, like radia returns) and prints the best of a few runs of the first
+render (conversion and binary encoding) and of a re-render from the cache
+(encoding only), and the size of the converted data. radia is not called,
+so fake_radia stands in for it.
+
+    python benchmarks/vtk_convert.py [n]
+"""
+
+from jupyter_rs_radia import gui_utils
+import numpy
+import sys
+import time
+
+
+def _drw_vtk(n):
+    v = numpy.random.rand(n * 12).tolist()
+    p = dict(
+        colors=numpy.random.rand(n * 3).tolist(),
+        lengths=[4] * n,
+        vertices=v,
+    )
+    return dict(polygons=p, lines=dict(p, vertices=list(v)))
+
+
+def _encode(d):
+    return gui_utils.to_binary(dict(data=[d]))
+
+
+def _size(d):
+    # python floats and ints in lists take a pointer and an object each
+    return sum(
+        a.nbytes if isinstance(a, numpy.ndarray) else len(a) * (8 + 24)
+        for p in d.values()
+        for a in p.values()
+    )
+
+
+def _time(fn, runs=3):
+    t = []
+    for _ in range(runs):
+        s = time.perf_counter()
+        fn()
+        t.append(time.perf_counter() - s)
+    return min(t)
+
+
+def main(n=100000):
+    import fake_radia
+
+    fake_radia.install()
+    from jupyter_rs_radia import radia_tk
+
+    d = _drw_vtk(n)
+    a = radia_tk.vtk_to_data(d)
+    assert numpy.allclose(a.polygons.vertices, d["polygons"]["vertices"], atol=1e-6)
+    print(
+        "{:>12} {:>12} {:>12} {:>10}".format("converter", "render", "re-render", "MB")
+    )
+    for f in (radia_tk.to_pkdict, radia_tk.vtk_to_data):
+        c = f(d)
+        print(
+            "{:>12} {:>12.4f} {:>12.4f} {:>10.1f}".format(
+                f.__name__,
+                _time(lambda: _encode(f(d))),
+                _time(lambda: _encode(c)),
+                _size(c) / 1e6,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
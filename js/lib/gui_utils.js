@@ -1,5 +1,12 @@
 import * as rsUtils from './rs_utils.js';
 
+export const GEOM_TYPES = ['lines', 'polygons', 'vectors'];
+
+const TYPED_ARRAYS = {
+    float32: Float32Array,
+    int32: Int32Array,
+};
+
 const COLOR_MAP = {
     afmhot:
         [
@@ -124,6 +131,42 @@ export function fgColorForBG(bgColor, format) {
     return formatColors([fg], format)[0];
 }
 
+// rebuild typed arrays from the binary buffers sent by the kernel (see gui_utils.to_binary)
+export function fromBinary(modelData) {
+    for (const o of (modelData || {}).data || []) {
+        for (const t of GEOM_TYPES) {
+            for (const k in (o[t] || {})) {
+                const a = o[t][k];
+                if (! a || ! a.dtype || ! a.buffer) {
+                    continue;
+                }
+                o[t][k] = toTypedArray(a.buffer, TYPED_ARRAYS[a.dtype]);
+            }
+        }
+    }
+    return modelData;
+}
+
+// join two arrays of the same kind, either of which may be a typed array
+export function concatArrays(a, b) {
+    if (! a || ! a.length) {
+        return b;
+    }
+    const c = new (b.constructor === Array ? Float32Array : b.constructor)(a.length + b.length);
+    c.set(a);
+    c.set(b, a.length);
+    return c;
+}
+
+// view a DataView received from the kernel as a typed array
+export function toTypedArray(dataView, arrayClass) {
+    const b = dataView;
+    // typed arrays must be aligned to their element size
+    return b.byteOffset % arrayClass.BYTES_PER_ELEMENT === 0 ?
+        new arrayClass(b.buffer, b.byteOffset, b.byteLength / arrayClass.BYTES_PER_ELEMENT) :
+        new arrayClass(b.buffer.slice(b.byteOffset, b.byteOffset + b.byteLength));
+}
+
 // interpolate each component to num_colors if the color map has fewer values
 //TODO(mvk): interpolate better
 export function getColorMap(name, numColors, format) {
@@ -7,17 +7,24 @@ import { VBoxModel, VBoxView } from '@jupyter-widgets/controls';
 import { scaleLinear } from 'd3-scale';
 
 const MSG_TYPE_DEBUG = 'debug';
+const MSG_TYPE_DOWNLOAD = 'download';
 const MSG_TYPE_ERROR = 'error';
 const MSG_TYPE_REFRESH = 'refresh';
 const MSG_TYPE_UPLOAD = 'upload';
+const MSG_TYPE_VECTORS = 'vectors';
 
 const MSG_TYPES = [
     MSG_TYPE_DEBUG,
+    MSG_TYPE_DOWNLOAD,
     MSG_TYPE_ERROR,
     MSG_TYPE_REFRESH,
-    MSG_TYPE_UPLOAD
+    MSG_TYPE_UPLOAD,
+    MSG_TYPE_VECTORS,
 ];
 
+// order of the binary buffers in vectors messages (see radia_viewer.VECTOR_ARRAYS)
+const VECTOR_ARRAYS = ['vertices', 'directions', 'magnitudes'];
+
 const template = [
     '<div class="radia-viewer">',
         '<div class="radia-viewer-title" style="font-weight: normal; text-align: center"></div>',
@@ -48,6 +55,12 @@ export class RadiaViewerModel extends VBoxModel {
             _view_module_version: '0.1.0',
         };
     }
+
+    static serializers = {
+        ...VBoxModel.serializers,
+        model_data: {deserialize: guiUtils.fromBinary},
+        outline: {deserialize: guiUtils.fromBinary},
+    };
 }
 
 function getVTKView(o) {
@@ -80,11 +93,34 @@ export class RadiaViewerView extends VBoxView {
     vtkViewer = null;
     vtkViewerEl =  null;
 
+    // the file arrives as binary buffers, and stays available from the export link
+    download(msg, buffers) {
+        const a = $(this.el).find('.radia-file-output a');
+        const url = a.attr('href') || '';
+        if (url.startsWith('blob:')) {
+            URL.revokeObjectURL(url);
+        }
+        a.attr({
+            download: msg.filename,
+            href: URL.createObjectURL(new Blob(buffers, {type: 'application/octet-stream'})),
+        }).text(msg.filename);
+        a[0].click();
+    }
+
+    // the outline is kept across field updates and only replaced when the geometry changes
+    getOutline() {
+        const o = this.model.get('outline') || {};
+        if (o.key !== this.model.get('model_data').outline) {
+            return null;
+        }
+        return ((o.data || [])[0] || {}).lines;
+    }
+
     getVectors() {
         return ((this.model.get('model_data').data || [])[0] || {}).vectors;
     }
 
-    handleCustomMessages(msg) {
+    handleCustomMessages(msg, buffers) {
         //rsUtils.rsdbg(msg);
         if (MSG_TYPES.indexOf(msg.type) < 0) {
             throw new Error(msg.type + ': Unknown message type')
@@ -94,6 +130,10 @@ export class RadiaViewerView extends VBoxView {
             rsUtils.rsdbg(msg.msg);
         }
 
+        if (msg.type === MSG_TYPE_DOWNLOAD) {
+            this.download(msg, buffers);
+        }
+
         if (msg.type === MSG_TYPE_ERROR) {
             rsUtils.rserr(msg.msg);
         }
@@ -105,6 +145,10 @@ export class RadiaViewerView extends VBoxView {
         if (msg.type === MSG_TYPE_UPLOAD) {
             this.upload();
         }
+
+        if (msg.type === MSG_TYPE_VECTORS) {
+            this.updateVectors(msg, buffers);
+        }
     }
 
     // have to return a function constructed with this viewer, otherwise "this" will refer to
@@ -176,6 +220,10 @@ export class RadiaViewerView extends VBoxView {
                 .call(view.fieldColorMapAxis);
 
             view.setTitle();
+            // the scene is rebuilt from this model, which the kernel keeps current,
+            // so a reloaded page shows the vectors updated in place
+            view.setVTKData();
+            view.refresh();
             view.vtkViewer.processPickedObject = view.processSelectedObject(view);
             view.vtkViewer.processPickedVector = view.processSelectedVector(view);
 
@@ -195,16 +243,14 @@ export class RadiaViewerView extends VBoxView {
                     fr.readAsText(f);
                 });
 
-            /*
             $(view.el).find('.radia-file-output')
                 .on('click', function (e) {
-                    //'data:text/plain;charset=utf-8,' + encodeURIComponent(csv);
                     e.stopPropagation();
                 });
-            */
         });
 
         this.model.on('change:field_color_map_name', this.setFieldColorMap, this);
+        this.model.on('change:model_data', this.setVTKData, this);
         this.model.on('change:title', this.setTitle, this);
         this.model.on('change:vector_scaling', this.setFieldScaling, this);
 
@@ -228,6 +274,27 @@ export class RadiaViewerView extends VBoxView {
         return null;
     }
 
+    // hand the model data, synced or updated locally, to the VTK view with the outline. The
+    // VTK view rebuilds its actors from the whole scene
+    setVTKData() {
+        const d = this.model.get('model_data');
+        if (! this.vtkViewer || ! d) {
+            return;
+        }
+        const o = this.getOutline();
+        const m = this.vtkViewer.model;
+        m.set('model_data', {
+            ...d,
+            data: (d.data || []).map(function (g, i) {
+                return i === 0 && o ? {...g, lines: o} : g;
+            }),
+        });
+        // the scene only lives in the browser: keep it out of the changes the VTK widget
+        // would send to the kernel when it next saves
+        delete (m._buffered_state_diff || {}).model_data;
+        this.vtkViewer.refresh();
+    }
+
     setFieldColorMap() {
         let mapName = this.model.get('field_color_map_name');
         if (! mapName) {
@@ -293,6 +360,34 @@ export class RadiaViewerView extends VBoxView {
         this.select('.radia-viewer-title').text(this.model.get('title'));
     }
 
+    // replace or append to the current vectors without a round trip through the model_data
+    // trait. Replaced vectors may belong to a new version of the geometry, whose outline has
+    // been synced separately
+    updateVectors(msg, buffers) {
+        const v = this.getVectors();
+        if (! v) {
+            return;
+        }
+        if (! msg.append) {
+            const d = this.model.get('model_data');
+            d.bounds = msg.bounds;
+            d.outline = msg.outline;
+        }
+        // without binary transport the arrays are lists in the message
+        VECTOR_ARRAYS.forEach(function (k, i) {
+            const b = buffers.length ?
+                guiUtils.toTypedArray(buffers[i], Float32Array) :
+                Float32Array.from(msg[k]);
+            v[k] = msg.append ? guiUtils.concatArrays(v[k], b) : b;
+        });
+        v.range = msg.append ?
+            [Math.min(v.range[0], msg.range[0]), Math.max(v.range[1], msg.range[1])] :
+            msg.range;
+        v.units = msg.units;
+        this.setVTKData();
+        this.refresh();
+    }
+
     upload() {
         $(this.el).find('.radia-file-input').trigger('click');
     }
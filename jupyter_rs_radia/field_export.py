@@ -0,0 +1,230 @@
+"""Field maps and magnetization in binary files that load without radia
+
+A file holds two (N, 3) float64 arrays, points and field (element centers
+and magnetization for M), and a metadata dict: geometry name, f_type, units,
+bounds and solve parameters. NPZ is always available; HDF5 needs h5py.
+"""
+
+from pykern import pkjson
+from pykern.pkcollections import PKDict
+import numpy
+import os
+import tempfile
+import zipfile
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+ARRAYS = ["points", "field"]
+
+FORMAT_HDF5 = "hdf5"
+FORMAT_NPZ = "npz"
+FORMATS = [FORMAT_NPZ, FORMAT_HDF5]
+
+# rows per HDF5 chunk
+HDF5_CHUNK_ROWS = 65536
+
+
+class Writer:
+    """Writes a file a block of points at a time, so the whole map is never in
+    memory. Use as a context manager, or call close()
+
+    Args:
+        f (str or file): path, or a binary file-like object (NPZ only)
+        num_points (int): total number of points to be written
+        metadata (dict): description of the map (see load())
+        fmt (str, optional): one of FORMATS; by default from the file
+            extension (.h5 or .hdf5 for HDF5)
+    Raises:
+        ValueError: if the format is unknown, or is HDF5 and h5py is not installed
+    """
+
+    def __init__(self, f, num_points, metadata, fmt=None):
+        self.fmt = fmt or _format(f)
+        if self.fmt not in FORMATS:
+            raise ValueError("Invalid format {} ({})".format(self.fmt, FORMATS))
+        self.num_points = num_points
+        self._count = 0
+        # an incomplete file is removed, if it has a path
+        self._path = f if isinstance(f, (str, os.PathLike)) else None
+        if self.fmt == FORMAT_HDF5:
+            _assert_h5py()
+            self._h5 = h5py.File(f, "w")
+            for k, v in metadata.items():
+                self._h5.attrs[k] = pkjson.dump_str(v)
+            self._out = [
+                self._h5.create_dataset(
+                    k,
+                    (num_points, 3),
+                    dtype="f8",
+                    chunks=(min(max(num_points, 1), HDF5_CHUNK_ROWS), 3),
+                )
+                for k in ARRAYS
+            ]
+            return
+        self._zip = zipfile.ZipFile(f, "w", compression=zipfile.ZIP_DEFLATED)
+        with self._zip.open("metadata.json", "w") as m:
+            m.write(pkjson.dump_pretty(metadata).encode())
+        # npy members are written one after the other, so the second is
+        # buffered in a temporary file
+        self._out = [
+            self._zip.open("{}.npy".format(ARRAYS[0]), "w", force_zip64=True),
+            _TempArray(),
+        ]
+        for o in self._out:
+            _write_npy_header(o, num_points)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.close()
+        else:
+            # the original exception propagates
+            self.abort()
+
+    def abort(self):
+        """Closes the file without completing it, and removes it if it has a
+        path
+        """
+        try:
+            if self.fmt == FORMAT_HDF5:
+                self._h5.close()
+            else:
+                self._out[0].close()
+                self._out[1].close()
+                self._zip.close()
+        finally:
+            if self._path is not None and os.path.exists(self._path):
+                os.remove(self._path)
+
+    def close(self):
+        """Completes the file
+
+        Raises:
+            ValueError: if fewer than num_points points were written. The
+                file is removed (see abort())
+        """
+        if self._count != self.num_points:
+            self.abort()
+            raise ValueError(
+                "{} points written, expected {}".format(self._count, self.num_points)
+            )
+        if self.fmt == FORMAT_HDF5:
+            self._h5.close()
+            return
+        self._out[0].close()
+        with self._zip.open(
+            "{}.npy".format(ARRAYS[1]), "w", force_zip64=True
+        ) as o, self._out[1] as t:
+            t.copy_to(o)
+        self._zip.close()
+
+    def write(self, block):
+        """Appends a block of [point, value] pairs
+
+        Args:
+            block (ndarray): (n, 2, 3) array, or equivalent
+        """
+        b = numpy.reshape(numpy.asarray(block, dtype=numpy.float64), (-1, 2, 3))
+        n = self._count + len(b)
+        if n > self.num_points:
+            raise ValueError("more than {} points written".format(self.num_points))
+        for i, o in enumerate(self._out):
+            if self.fmt == FORMAT_HDF5:
+                o[self._count : n] = b[:, i]
+            else:
+                o.write(numpy.ascontiguousarray(b[:, i]).tobytes())
+        self._count = n
+
+
+class _TempArray:
+    # file-like buffer for the second npy member
+    def __init__(self):
+        self._f = tempfile.TemporaryFile()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._f.close()
+
+    def copy_to(self, out):
+        self._f.seek(0)
+        while True:
+            b = self._f.read(1 << 24)
+            if not b:
+                break
+            out.write(b)
+
+    def write(self, b):
+        self._f.write(b)
+
+
+def load(f):
+    """Reads a file written by Writer or save()
+
+    Args:
+        f (str or file): path or file-like object
+    Returns:
+        PKDict: the metadata (name, f_type, units, bounds, solve...) with
+        points and field as (N, 3) arrays. HDF5 arrays are read lazily as
+        h5py datasets, which keep the file open: the caller closes it with
+        field.file.close() when done
+    Raises:
+        ValueError: if the file is HDF5 and h5py is not installed
+    """
+    if _format(f) == FORMAT_HDF5:
+        _assert_h5py()
+        h = h5py.File(f, "r")
+        d = PKDict({k: pkjson.load_any(v) for k, v in h.attrs.items()})
+        d.update({k: h[k] for k in ARRAYS})
+        return d
+    with zipfile.ZipFile(f) as z:
+        d = PKDict(pkjson.load_any(z.read("metadata.json")))
+        for k in ARRAYS:
+            with z.open("{}.npy".format(k)) as a:
+                d[k] = numpy.lib.format.read_array(a)
+    return d
+
+
+def save(f, result, fmt=None, chunk_size=HDF5_CHUNK_ROWS):
+    """Writes a field map already in memory
+
+    Args:
+        f (str or file): path or file-like object
+        result (dict): metadata with points and field arrays, such as a
+            RadiaGeomMgr.run_batch() result
+        fmt (str, optional): one of FORMATS (see Writer)
+        chunk_size (int): rows written at a time
+    """
+    p = numpy.reshape(result["points"], (-1, 3))
+    v = numpy.reshape(result["field"], (-1, 3))
+    with Writer(
+        f, len(p), {k: x for k, x in result.items() if k not in ARRAYS}, fmt=fmt
+    ) as w:
+        for i in range(0, len(p), chunk_size):
+            w.write(numpy.stack((p[i : i + chunk_size], v[i : i + chunk_size]), axis=1))
+
+
+def _assert_h5py():
+    if h5py is None:
+        raise ValueError("HDF5 files require h5py")
+
+
+def _format(f):
+    n = str(f if isinstance(f, (str, os.PathLike)) else getattr(f, "name", ""))
+    return FORMAT_HDF5 if n.endswith((".h5", ".hdf5")) else FORMAT_NPZ
+
+
+def _write_npy_header(out, num_points):
+    numpy.lib.format.write_array_header_2_0(
+        out,
+        PKDict(descr="<f8", fortran_order=False, shape=(num_points, 3)),
+    )
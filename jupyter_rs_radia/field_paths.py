@@ -0,0 +1,311 @@
+"""Points for evaluating fields, generated as (N, 3) arrays"""
+
+import math
+import numpy
+import os
+import warnings
+
+# bytes of text parsed at a time by load()
+LOAD_CHUNK_BYTES = 1 << 24
+
+
+class PointArray:
+    """Growable contiguous (N, 3) array of points
+
+    Args:
+        capacity (int): initial number of points allocated
+    """
+
+    def __init__(self, capacity=1024):
+        self._arr = numpy.empty((capacity, 3))
+        self._len = 0
+        # assigned arrays belong to the caller (or are memory mapped), so
+        # they are never written to
+        self._owned = True
+
+    def __len__(self):
+        return self._len
+
+    def append(self, points):
+        """Adds points at the end, growing the storage geometrically
+
+        Args:
+            points (list): positions, flattened, as [x, y, z] lists, or an array
+        """
+        p = numpy.reshape(numpy.asarray(points, dtype=float), (-1, 3))
+        n = self._len + len(p)
+        if n > len(self._arr) or not self._owned:
+            a = numpy.empty((max(n, 2 * len(self._arr)), 3))
+            a[: self._len] = self._arr[: self._len]
+            self._arr = a
+            self._owned = True
+        self._arr[self._len : n] = p
+        self._len = n
+
+    def assign(self, points):
+        """Replaces the points with an existing (N, 3) array without copying it
+
+        Args:
+            points (ndarray): positions, which may be memory mapped
+        """
+        self._arr = points
+        self._len = len(points)
+        self._owned = False
+
+    def clear(self):
+        self._len = 0
+        if not self._owned:
+            self._arr = numpy.empty((0, 3))
+            self._owned = True
+
+    @property
+    def points(self):
+        """(N, 3) view of the points, valid until the next append"""
+        return self._arr[: self._len]
+
+
+def arc(ctr, r, theta, phi, psi_begin, psi_end, num_points):
+    """Points along part of a circle, including both ends. The orientation is
+    the same as circle()
+
+    Args:
+        ctr (list): [x, y, z] of the center
+        r (float): radius
+        theta (float): rotation about the x axis
+        phi (float): rotation about the z axis
+        psi_begin (float): first angle in the circle's plane
+        psi_end (float): last angle in the circle's plane
+        num_points (int): number of points
+    Returns:
+        ndarray: (num_points, 3) positions
+    """
+    return _ring(ctr, r, theta, phi, numpy.linspace(psi_begin, psi_end, num_points))
+
+
+def circle(ctr, r, theta, phi, num_points):
+    """Points evenly spaced around a circle, starting at psi = 0
+
+    Args:
+        ctr (list): [x, y, z] of the center
+        r (float): radius
+        theta (float): rotation about the x axis
+        phi (float): rotation about the z axis
+        num_points (int): number of points
+    Returns:
+        ndarray: (num_points, 3) positions
+    """
+    return _ring(
+        ctr, r, theta, phi, numpy.arange(num_points) * (2.0 * math.pi / num_points)
+    )
+
+
+def grid(p_min, p_max, shape):
+    """Points filling a box, varying fastest along z
+
+    Args:
+        p_min (list): [x, y, z] of one corner
+        p_max (list): [x, y, z] of the opposite corner
+        shape (list): number of points along each axis [nx, ny, nz]
+    Returns:
+        ndarray: (nx * ny * nz, 3) positions
+    """
+    a = [numpy.linspace(p_min[i], p_max[i], shape[i]) for i in range(3)]
+    return numpy.stack(numpy.meshgrid(*a, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+def helix(ctr, r, theta, phi, pitch, turns, num_points):
+    """Points along a helix around the normal of the circle() with the same
+    orientation, starting in the plane of that circle
+
+    Args:
+        ctr (list): [x, y, z] of the center of the first turn
+        r (float): radius
+        theta (float): rotation about the x axis
+        phi (float): rotation about the z axis
+        pitch (float): distance along the axis per turn
+        turns (float): number of turns
+        num_points (int): number of points, including both ends
+    Returns:
+        ndarray: (num_points, 3) positions
+    """
+    psi = numpy.linspace(0.0, 2.0 * math.pi * turns, num_points)
+    e1, e2 = _circle_axes(theta, phi)
+    n = numpy.cross(e1, e2)
+    return _ring(ctr, r, theta, phi, psi) + numpy.outer(
+        pitch * psi / (2.0 * math.pi), n / numpy.linalg.norm(n)
+    )
+
+
+def line(begin, end, num_points):
+    """Points evenly spaced from begin to end, inclusive
+
+    Args:
+        begin (list): [x, y, z] of the first point
+        end (list): [x, y, z] of the last point
+        num_points (int): number of points
+    Returns:
+        ndarray: (num_points, 3) positions
+    """
+    b = numpy.asarray(begin, dtype=float)
+    p = b + numpy.outer(
+        numpy.linspace(0.0, 1.0, num_points), numpy.asarray(end, dtype=float) - b
+    )
+    p[-1] = end
+    return p
+
+
+def load(f, chunk_bytes=LOAD_CHUNK_BYTES):
+    """Reads points from a .npy file, which is memory mapped, or from text
+    with comma and/or whitespace separated coordinates (x0, y0, z0, x1,...),
+    which is parsed in chunks
+
+    Args:
+        f (str or file): path or file-like object
+        chunk_bytes (int): size of text chunks
+    Returns:
+        ndarray: (N, 3) positions
+    Raises:
+        ValueError: if the file is not numeric or the number of coordinates is
+            not a multiple of 3
+    """
+    if isinstance(f, (str, os.PathLike)):
+        if str(f).endswith(".npy"):
+            return _xyz(numpy.load(f, mmap_mode="r"))
+        with open(f, "rb") as t:
+            return _xyz(_read_text(t, chunk_bytes))
+    if getattr(f, "name", "").endswith(".npy"):
+        return _xyz(numpy.load(f))
+    return _xyz(_read_text(f, chunk_bytes))
+
+
+def plane(origin, u, v, shape):
+    """Points filling the parallelogram spanned by two axes, varying fastest
+    along the second
+
+    Args:
+        origin (list): [x, y, z] of one corner
+        u (list): first in-plane axis; its length is the extent along it
+        v (list): second in-plane axis
+        shape (list): number of points along each axis [nu, nv]
+    Returns:
+        ndarray: (nu * nv, 3) positions
+    """
+    s, t = numpy.meshgrid(
+        numpy.linspace(0.0, 1.0, shape[0]),
+        numpy.linspace(0.0, 1.0, shape[1]),
+        indexing="ij",
+    )
+    return (
+        numpy.asarray(origin, dtype=float)
+        + s[..., numpy.newaxis] * numpy.asarray(u, dtype=float)
+        + t[..., numpy.newaxis] * numpy.asarray(v, dtype=float)
+    ).reshape(-1, 3)
+
+
+def polyline(vertices, num_points):
+    """Points evenly spaced by distance along connected segments, including
+    the first and last vertices
+
+    Args:
+        vertices (list): [[x, y, z], ...] at least two corners of the path
+        num_points (int): number of points
+    Returns:
+        ndarray: (num_points, 3) positions
+    """
+    v = numpy.reshape(numpy.asarray(vertices, dtype=float), (-1, 3))
+    d = numpy.concatenate(
+        ([0.0], numpy.cumsum(numpy.linalg.norm(numpy.diff(v, axis=0), axis=1)))
+    )
+    s = numpy.linspace(0.0, d[-1], num_points)
+    return numpy.stack([numpy.interp(s, d, v[:, i]) for i in range(3)], axis=1)
+
+
+def stride_indices(n, budget, shape=None):
+    """Indices of an evenly spaced subset of at most budget points
+
+    Args:
+        n (int): number of points
+        budget (int): maximum number of indices
+        shape (list, optional): the points form a grid of this shape, which is
+            strided along each axis so the subset is also a grid
+    Returns:
+        ndarray: sorted indices
+    """
+    if n <= budget:
+        return numpy.arange(n)
+    if shape is None:
+        return numpy.arange(0, n, math.ceil(n / budget))
+    i = numpy.arange(n).reshape(shape)
+    d = sum(1 for s in shape if s > 1)
+    s = math.ceil((n / budget) ** (1.0 / d))
+    while True:
+        r = i[tuple(slice(None, None, s) for _ in shape)].ravel()
+        if len(r) <= budget:
+            return r
+        s += 1
+
+
+def _circle_axes(theta, phi):
+    # in-plane directions multiplied by r * sin(psi) and r * cos(psi):
+    # the initial position [r * sin(psi), r * cos(psi), 0] is rotated about
+    # the x axis by theta, then about the z axis by phi
+    return (
+        numpy.array([math.cos(phi), math.sin(phi), 0.0]),
+        numpy.array(
+            [
+                -math.cos(theta) * math.sin(phi),
+                -math.cos(theta) * math.cos(phi),
+                math.sin(theta),
+            ]
+        ),
+    )
+
+
+def _ring(ctr, r, theta, phi, psi):
+    e1, e2 = _circle_axes(theta, phi)
+    return (
+        numpy.asarray(ctr, dtype=float)
+        + numpy.outer(r * numpy.sin(psi), e1)
+        + numpy.outer(r * numpy.cos(psi), e2)
+    )
+
+
+def _parse_text(b):
+    # numpy parses the text in C, without an object per number
+    b = b.replace(b",", b" ")
+    # fromstring reads blank text as [-1]
+    if not b.strip():
+        return numpy.empty(0)
+    # older numpy only warns about unparsed data
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return numpy.fromstring(b, sep=" ")
+        except (DeprecationWarning, ValueError) as e:
+            raise ValueError("invalid point data: {}".format(e))
+
+
+def _read_text(f, chunk_bytes):
+    a = []
+    rest = b""
+    while True:
+        c = f.read(chunk_bytes)
+        if not c:
+            break
+        if isinstance(c, str):
+            c = c.encode("ascii")
+        c = rest + c
+        # do not split a number across chunks
+        i = max(c.rfind(x) for x in (b",", b" ", b"\n", b"\r", b"\t")) + 1
+        rest = c[i:]
+        a.append(_parse_text(c[:i]))
+    a.append(_parse_text(rest))
+    return numpy.concatenate(a)
+
+
+def _xyz(arr):
+    if arr.size % 3 != 0:
+        raise ValueError(
+            "number of coordinates {} is not a multiple of 3".format(arr.size)
+        )
+    return arr.reshape(-1, 3)
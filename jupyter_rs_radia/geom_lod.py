@@ -0,0 +1,194 @@
+"""Fewer polygons for large geometries, keeping each object a separate element"""
+
+from pykern.pkcollections import PKDict
+import numpy
+
+# vertices closer than this fraction of the size of the geometry are the same
+# when matching faces
+MATCH_TOLERANCE = 1e-6
+
+# faces of a box, as indices into its corners (bit 0 = x, 1 = y, 2 = z)
+_BOX_FACES = numpy.array(
+    [
+        [0, 2, 3, 1],
+        [4, 5, 7, 6],
+        [0, 1, 5, 4],
+        [2, 6, 7, 3],
+        [0, 4, 6, 2],
+        [1, 3, 7, 5],
+    ]
+)
+
+# odd constants for hashing quantized coordinates
+_HASH = numpy.array(
+    [
+        [0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9],
+        [0xD6E8FEB86659FD93, 0x94D049BB133111EB, 0xBF58476D1CE4E5B9],
+    ],
+    dtype=numpy.uint64,
+)
+
+
+def num_polygons(objs):
+    """
+    Args:
+        objs (list): geometry objects
+    Returns:
+        int: total number of polygons
+    """
+    return sum(len(o.polygons.lengths) for o in objs)
+
+
+def reduce(objs, max_polygons):
+    """Draws the same geometry with at most about max_polygons polygons.
+    Faces shared by two objects, such as those between adjacent blocks of a
+    subdivided magnet, are removed first. Then the objects with the most
+    polygons are drawn as their bounding boxes until the total is within the
+    budget. Each object stays a separate element, so picking is unaffected
+
+    Args:
+        objs (list): geometry objects, with polygons and lines as arrays
+        max_polygons (int): budget
+    Returns:
+        list: new geometry objects, or objs if already within the budget
+    """
+    if num_polygons(objs) <= max_polygons:
+        return objs
+    objs = _remove_shared_faces(objs)
+    n = num_polygons(objs)
+    for i in sorted(
+        range(len(objs)), key=lambda i: len(objs[i].polygons.lengths), reverse=True
+    ):
+        if n <= max_polygons:
+            break
+        m = len(objs[i].polygons.lengths)
+        if m <= len(_BOX_FACES):
+            break
+        objs[i] = _box(objs[i])
+        n -= m - len(_BOX_FACES)
+    return objs
+
+
+def _box(obj):
+    v = numpy.reshape(obj.polygons.vertices, (-1, 3))
+    c = numpy.stack((v.min(axis=0), v.max(axis=0)))
+    corners = numpy.array(
+        [[c[(i >> a) & 1, a] for a in range(3)] for i in range(8)],
+        dtype=numpy.float32,
+    )
+    f = corners[_BOX_FACES].reshape(-1, 3)
+    n = len(_BOX_FACES)
+    colors = numpy.reshape(obj.polygons.colors, (-1, 3))[:1]
+    return PKDict(
+        obj,
+        lines=PKDict(
+            obj.lines,
+            colors=numpy.repeat(numpy.reshape(obj.lines.colors, (-1, 3))[:1], n, 0)
+            .ravel()
+            .astype(numpy.float32),
+            lengths=numpy.full(n, 5, dtype=numpy.int32),
+            # closed loops
+            vertices=corners[numpy.c_[_BOX_FACES, _BOX_FACES[:, 0]]].ravel(),
+        ),
+        polygons=PKDict(
+            obj.polygons,
+            colors=numpy.repeat(colors, n, 0).ravel().astype(numpy.float32),
+            lengths=numpy.full(n, 4, dtype=numpy.int32),
+            vertices=f.ravel(),
+        ),
+    )
+
+
+def _face_keys(prim, step):
+    # order independent hash of the number and positions of the vertices of
+    # each face, ignoring the last vertex of closed loops
+    l = numpy.asarray(prim.lengths, dtype=numpy.int64)
+    if not len(l):
+        return numpy.empty(0, dtype=numpy.uint64)
+    q = numpy.round(prim.vertices / step).astype(numpy.int64).view(numpy.uint64)
+    start = numpy.concatenate(([0], numpy.cumsum(l)[:-1]))
+    end = start + l - 1
+    closed = (l > 1) & numpy.all(q[start] == q[end], axis=1)
+    with numpy.errstate(over="ignore"):
+        h = (q * _HASH[0]).sum(axis=1, dtype=numpy.uint64)
+        h ^= h >> numpy.uint64(31)
+        h *= _HASH[1, 0]
+        h[end[closed]] = 0
+        return numpy.add.reduceat(h, start, dtype=numpy.uint64) + (
+            (l - closed).astype(numpy.uint64) * _HASH[1, 1]
+        )
+
+
+def _flatten(objs, prim_type):
+    # the primitives of all objects as one, with the number of faces of each
+    l = [numpy.asarray(o[prim_type].lengths, dtype=numpy.int64) for o in objs]
+    c = [numpy.asarray(o[prim_type].colors) for o in objs]
+    return PKDict(
+        colors=(
+            numpy.concatenate(c).reshape(-1, 3)
+            if all(len(x) == 3 * len(y) for x, y in zip(c, l))
+            else None
+        ),
+        face_counts=numpy.array([len(x) for x in l]),
+        lengths=numpy.concatenate(l),
+        vertices=numpy.concatenate(
+            [numpy.reshape(o[prim_type].vertices, (-1, 3)) for o in objs]
+        ),
+    )
+
+
+def _split(prim, face_mask, num_objs):
+    # the kept faces of each object
+    o = numpy.repeat(numpy.arange(num_objs), prim.face_counts)[face_mask]
+    f = numpy.cumsum(numpy.bincount(o, minlength=num_objs))[:-1]
+    l = prim.lengths[face_mask]
+    v = numpy.cumsum(numpy.bincount(o, weights=l, minlength=num_objs))[:-1]
+    return PKDict(
+        colors=(
+            None
+            if prim.colors is None
+            else [x.ravel() for x in numpy.split(prim.colors[face_mask], f)]
+        ),
+        lengths=numpy.split(l.astype(numpy.int32), f),
+        vertices=[
+            x.ravel()
+            for x in numpy.split(
+                prim.vertices[numpy.repeat(face_mask, prim.lengths)],
+                v.astype(numpy.int64),
+            )
+        ],
+    )
+
+
+def _remove_shared_faces(objs):
+    f = PKDict({t: _flatten(objs, t) for t in ("lines", "polygons")})
+    if not len(f.polygons.vertices):
+        return list(objs)
+    step = MATCH_TOLERANCE * max(
+        float(numpy.ptp(f.polygons.vertices, axis=0).max()), 1.0
+    )
+    k = _face_keys(f.polygons, step)
+    u, c = numpy.unique(k, return_counts=True)
+    shared = u[c > 1]
+    s = PKDict(
+        {
+            t: _split(
+                p,
+                ~numpy.isin(k if t == "polygons" else _face_keys(p, step), shared),
+                len(objs),
+            )
+            for t, p in f.items()
+        }
+    )
+    res = []
+    for i, o in enumerate(objs):
+        o = PKDict(o)
+        for t, p in s.items():
+            o[t] = PKDict(
+                o[t],
+                colors=o[t].colors if p.colors is None else p.colors[i],
+                lengths=p.lengths[i],
+                vertices=p.vertices[i],
+            )
+        res.append(o)
+    return res
@@ -1,12 +1,22 @@
 from __future__ import absolute_import, division, print_function
 
 from pykern.pkcollections import PKDict
+import numpy
 
 GEOM_TYPE_LINES = 'lines'
 GEOM_TYPE_POLYS = 'polygons'
 GEOM_TYPE_VECTS = 'vectors'
 GEOM_TYPES = [GEOM_TYPE_LINES, GEOM_TYPE_POLYS, GEOM_TYPE_VECTS]
 
+# arrays in geometry objects that are sent as binary buffers, and their types
+GEOM_ARRAY_TYPES = PKDict(
+    colors='float32',
+    directions='float32',
+    lengths='int32',
+    magnitudes='float32',
+    vertices='float32',
+)
+
 
 def get_test_obj():
     box1 = new_geom_object()
@@ -72,6 +82,58 @@ def get_test_obj():
     return PKDict(name='Test', data=[box1, box2])
 
 
+def to_binary(model_data):
+    """Replaces the large arrays in model data with typed binary buffers.
+
+    The widget layer sends memoryviews as separate binary messages, so only the
+    remaining metadata is encoded as JSON.
+
+    Args:
+        model_data (dict): model data whose "data" is a list of geometry objects
+    Returns:
+        PKDict: a shallow copy with each array replaced by {dtype, buffer}
+    """
+    if not model_data or 'data' not in model_data:
+        return model_data
+    d = PKDict(model_data)
+    d.data = [_geom_obj_to_binary(o) for o in model_data['data']]
+    return d
+
+
+def to_lists(d):
+    """Converts any arrays in model data to lists so it can be encoded as JSON
+
+    Args:
+        d (object): model data
+    Returns:
+        object: a copy of any containers that held arrays
+    """
+    if isinstance(d, numpy.ndarray):
+        return d.tolist()
+    if isinstance(d, dict):
+        return PKDict({k: to_lists(v) for k, v in d.items()})
+    if isinstance(d, list):
+        return [to_lists(v) for v in d]
+    return d
+
+
+def _array_to_binary(arr, dtype):
+    a = numpy.ascontiguousarray(arr, dtype=dtype).ravel()
+    return PKDict(dtype=dtype, buffer=memoryview(a))
+
+
+def _geom_obj_to_binary(geom_obj):
+    o = PKDict(geom_obj)
+    for t in GEOM_TYPES:
+        if t not in o:
+            continue
+        o[t] = PKDict(o[t])
+        for k in GEOM_ARRAY_TYPES:
+            if k in o[t]:
+                o[t][k] = _array_to_binary(o[t][k], GEOM_ARRAY_TYPES[k])
+    return o
+
+
 def _obj_has_data_type(geom_obj, d_type):
     if geom_obj is None:
         return False
@@ -0,0 +1,130 @@
+"""Fewer magnetization vectors for geometries with many elements
+
+Each function takes the (N, 2, 3) array of [center, M] pairs of radia.ObjM
+and returns the vectors to draw, with the vector each element is drawn as
+(members, -1 if it is not drawn), so a drawn vector can be traced back to
+the elements of the full array.
+"""
+
+from pykern.pkcollections import PKDict
+import numpy
+
+AGGREGATION_CONTAINER = "container"
+AGGREGATION_LARGEST = "largest"
+AGGREGATION_VOXEL = "voxel"
+AGGREGATIONS = [AGGREGATION_CONTAINER, AGGREGATION_LARGEST, AGGREGATION_VOXEL]
+
+# factor by which automatically sized voxels grow until they fit the budget
+_VOXEL_GROWTH = 1.25
+
+
+def by_group(m, groups):
+    """Draws each group of elements as one vector: the mean of their
+    magnetization at the mean of their centers. radia.ObjM does not give
+    volumes, so the means are not weighted
+
+    Args:
+        m (ndarray): (N, 2, 3) [center, M] pairs
+        groups (ndarray): (N,) integer group of each element
+    Returns:
+        PKDict: vectors ((K, 2, 3) array, one per non-empty group, in group
+        order) and members
+    """
+    u, members = numpy.unique(groups, return_inverse=True)
+    n = numpy.bincount(members, minlength=len(u))[:, numpy.newaxis]
+    v = numpy.empty((len(u), 2, 3))
+    for i in range(2):
+        for a in range(3):
+            v[:, i, a] = numpy.bincount(members, weights=m[:, i, a], minlength=len(u))
+    v /= n[:, numpy.newaxis]
+    return PKDict(vectors=v, members=members.ravel())
+
+
+def by_voxel(m, max_vectors, size=None):
+    """Draws the elements in each cube of a grid as one vector (see by_group)
+
+    Args:
+        m (ndarray): (N, 2, 3) [center, M] pairs
+        max_vectors (int): budget, when size is not given
+        size (float, optional): edge length of the cubes. By default, the
+            smallest that results in at most max_vectors vectors
+    Returns:
+        PKDict: vectors and members
+    """
+    c = m[:, 0]
+    if not len(c):
+        return by_group(m, numpy.empty(0, dtype=numpy.int64))
+    lo = c.min(axis=0)
+    if size is None:
+        e = numpy.ptp(c, axis=0)
+        e = e[e > 0]
+        if not len(e):
+            return by_group(m, numpy.zeros(len(c), dtype=numpy.int64))
+        # the cubes fill the bounding box, so at most about max_vectors are
+        # occupied. Fewer are, unless the elements fill the box
+        s = (numpy.prod(e) / max(max_vectors, 1)) ** (1 / len(e))
+        while True:
+            r = by_voxel(m, max_vectors, size=s)
+            if len(r.vectors) <= max(max_vectors, 1):
+                return r
+            s *= _VOXEL_GROWTH
+    i = numpy.floor((c - lo) / size).astype(numpy.int64)
+    n = i.max(axis=0) + 1
+    return by_group(m, (i[:, 0] * n[1] + i[:, 1]) * n[2] + i[:, 2])
+
+
+def largest(m, max_vectors):
+    """Draws only the max_vectors elements of largest |M|
+
+    Args:
+        m (ndarray): (N, 2, 3) [center, M] pairs
+        max_vectors (int): budget
+    Returns:
+        PKDict: vectors (in element order) and members
+    """
+    members = numpy.full(len(m), -1, dtype=numpy.int64)
+    if max_vectors >= len(m):
+        i = numpy.arange(len(m))
+    else:
+        i = numpy.sort(
+            numpy.argpartition(-numpy.linalg.norm(m[:, 1], axis=1), max_vectors)[
+                :max_vectors
+            ]
+        )
+    members[i] = numpy.arange(len(i))
+    return PKDict(vectors=m[i], members=members)
+
+
+def reduce(m, aggregation, max_vectors, groups=None, voxel_size=None):
+    """Draws the magnetization with at most max_vectors vectors, or with one
+    per element if that is within the budget
+
+    Args:
+        m (ndarray): (N, 2, 3) [center, M] pairs
+        aggregation (str): one of AGGREGATIONS
+        max_vectors (int): budget
+        groups (ndarray, optional): top-level container of each element, for
+            AGGREGATION_CONTAINER. Without it, or if there are more containers
+            than max_vectors, the containers are aggregated by voxel
+        voxel_size (float, optional): see by_voxel. Not bounded by max_vectors
+    Returns:
+        PKDict: vectors and members
+    Raises:
+        ValueError: if aggregation is invalid
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(
+            "Invalid aggregation {} ({})".format(aggregation, AGGREGATIONS)
+        )
+    m = numpy.reshape(m, (-1, 2, 3))
+    if len(m) <= max_vectors:
+        return PKDict(vectors=m, members=numpy.arange(len(m)))
+    if aggregation == AGGREGATION_LARGEST:
+        return largest(m, max_vectors)
+    if aggregation == AGGREGATION_CONTAINER and groups is not None:
+        r = by_group(m, groups)
+        if len(r.vectors) <= max_vectors:
+            return r
+        v = by_voxel(r.vectors, max_vectors, size=voxel_size)
+        return PKDict(vectors=v.vectors, members=v.members[r.members])
+    return by_voxel(m, max_vectors, size=voxel_size)
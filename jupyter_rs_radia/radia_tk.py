@@ -1,7 +1,20 @@
+import collections
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
 import numpy
+import os
 import radia
 import sys
+import threading
+import time
 
+from jupyter_rs_radia import field_export
+from jupyter_rs_radia import geom_lod
+from jupyter_rs_radia import mag_lod
 from jupyter_rs_vtk import gui_utils
 from numpy import linalg
 from pykern.pkcollections import PKDict
@@ -21,6 +34,32 @@ POINT_FIELD_TYPES = [
 ]
 FIELD_TYPES.extend(POINT_FIELD_TYPES)
 
+# iterations per radia.Solve() call when solving in the background
+SOLVE_CHUNK = 100
+
+# points per radia.Fld() call when evaluating fields in chunks
+FIELD_CHUNK = 50000
+
+# chunks per process when evaluating fields in parallel, for load balancing
+FIELD_POOL_CHUNKS_PER_WORKER = 4
+
+# default memory budget for rendered geometry data
+RENDER_CACHE_BYTES = 256 * 1024 * 1024
+
+# types of the arrays in each primitive of radia.ObjDrwVTK output, matching
+# what is sent to the viewer
+VTK_ARRAY_TYPES = PKDict(
+    colors=numpy.float32,
+    lengths=numpy.int32,
+    vertices=numpy.float32,
+)
+
+# default memory budget for computed field values
+FIELD_CACHE_BYTES = 256 * 1024 * 1024
+
+# default disk budget for solved geometries
+SOLVE_CACHE_BYTES = 1024 * 1024 * 1024
+
 # these might be available from radia
 FIELD_UNITS = PKDict(
     {
@@ -33,6 +72,90 @@ FIELD_UNITS = PKDict(
 )
 
 
+def to_point_vector_array(points, values):
+    """Pairs points with the field values there
+
+    Args:
+        points (list): flattened positions ([x1, y1, z1,...xn, yn, zn])
+        values (list): radia.Fld() output for those positions, flat or nested
+    Returns:
+        ndarray: (N, 2, 3) array of [point, value] pairs
+    """
+    return numpy.stack((_to_xyz(points), _to_xyz(values)), axis=1)
+
+
+def vectors_to_data(pv_arr, units, points=None):
+    """Converts field values to the vectors of a geometry object
+
+    Args:
+        pv_arr (list): [[[px, py, pz], [vx, vy, vx]], ...] or an equivalent array.
+            If points are supplied, the flattened output of radia.Fld()
+            ([vx1, vy1, vz1,...vxn, vyn, vzn])
+        units (str): units of the field
+        points (list, optional): flattened positions ([x1, y1, z1,...xn, yn, zn])
+    Returns:
+        PKDict: vertices, directions, magnitudes, range and units
+    """
+    p, v = (
+        _point_vector_arrays(pv_arr)
+        if points is None
+        else (_to_xyz(points), _to_xyz(pv_arr))
+    )
+    n = linalg.norm(v, axis=1)
+    return PKDict(
+        colors=[],
+        directions=(v / numpy.where(n > 0, n, 1.0)[:, numpy.newaxis]).ravel(),
+        lengths=[],
+        magnitudes=n,
+        range=[float(n.min()), float(n.max())] if n.size else [sys.float_info.max, 0.0],
+        units=units,
+        vertices=p.ravel(),
+    )
+
+
+def _point_vector_arrays(pv_arr):
+    a = numpy.reshape(numpy.asarray(pv_arr, dtype=float), (-1, 2, 3))
+    return a[:, 0], a[:, 1]
+
+
+def _radia_path(path):
+    # radia wants a flat list of coordinates
+    if isinstance(path, numpy.ndarray):
+        return path.ravel().tolist()
+    return path
+
+
+def _to_xyz(a):
+    return numpy.reshape(numpy.asarray(a, dtype=float), (-1, 3))
+
+
+def vtk_to_data(d):
+    """Converts the output of radia.ObjDrwVTK to a geometry object, with the
+    arrays of each primitive as contiguous numpy arrays (see VTK_ARRAY_TYPES)
+
+    Args:
+        d (dict): {polygons: {colors, lengths, vertices}, lines: {...}}
+    Returns:
+        PKDict: geometry object
+    """
+    o = PKDict()
+    for t, p in d.items():
+        if not isinstance(p, dict):
+            o[t] = p
+            continue
+        o[t] = PKDict(
+            {
+                k: (
+                    numpy.asarray(v, dtype=VTK_ARRAY_TYPES[k])
+                    if k in VTK_ARRAY_TYPES
+                    else v
+                )
+                for k, v in p.items()
+            }
+        )
+    return o
+
+
 def to_pkdict(d):
     pkd = PKDict(d)
     for k, v in pkd.items():
@@ -48,116 +171,1150 @@ def to_pkdict(d):
     return pkd
 
 
+def data_nbytes(d):
+    """Estimates the memory used by geometry or field data
+
+    Args:
+        d (object): arrays, lists, or dicts thereof
+    Returns:
+        int: approximate size in bytes
+    """
+    if isinstance(d, numpy.ndarray):
+        return d.nbytes
+    if isinstance(d, dict):
+        return sum(data_nbytes(v) for v in d.values())
+    if isinstance(d, (list, tuple)):
+        if d and isinstance(d[0], (dict, list, tuple, numpy.ndarray)):
+            return sum(data_nbytes(v) for v in d)
+        return 8 * len(d)
+    return 8
+
+
+class LRUCache:
+    """Least-recently-used cache with a memory budget
+
+    Args:
+        max_bytes (int): entries are evicted once their total size exceeds this
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()
+        # the radia worker thread invalidates entries after solving
+        self._lock = threading.RLock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, nbytes=None):
+        n = data_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            # an entry larger than the whole budget is not worth keeping
+            if n > self.max_bytes:
+                return value
+            self._entries[key] = (value, n)
+            self.nbytes += n
+            while self.nbytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+            return value
+
+    def remove_if(self, predicate):
+        with self._lock:
+            for k in [k for k in self._entries if predicate(k)]:
+                self._discard(k)
+
+    def stats(self):
+        with self._lock:
+            return PKDict(
+                entries=len(self._entries),
+                evictions=self.evictions,
+                hits=self.hits,
+                max_bytes=self.max_bytes,
+                misses=self.misses,
+                nbytes=self.nbytes,
+            )
+
+    def _discard(self, key):
+        self.nbytes -= self._entries.pop(key)[1]
+
+
+# the geometry restored in a FieldPool worker process
+_pool_geom = None
+
+
+def batch_columns(results):
+    """Combines the results of RadiaGeomMgr.run_batch() into one table
+
+    Args:
+        results (list): run_batch() results
+    Returns:
+        PKDict: equal length 1-D arrays job (index into results), x, y, z
+        (positions) and fx, fy, fz (field values)
+    """
+    p = (
+        numpy.concatenate([r.points for r in results])
+        if results
+        else numpy.empty((0, 3))
+    )
+    v = (
+        numpy.concatenate([r.field for r in results])
+        if results
+        else numpy.empty((0, 3))
+    )
+    return PKDict(
+        job=numpy.repeat(numpy.arange(len(results)), [len(r.points) for r in results]),
+        x=p[:, 0],
+        y=p[:, 1],
+        z=p[:, 2],
+        fx=v[:, 0],
+        fy=v[:, 1],
+        fz=v[:, 2],
+    )
+
+
+def sweep_best(table):
+    """The fastest converged run of RadiaGeomMgr.sweep_solve(), or the most
+    precise if none converged
+
+    Args:
+        table (dict): sweep_solve() result
+    Returns:
+        PKDict: index (row of the table), prec, max_iter and method, for
+        RadiaViewer.set_solve_params()
+    Raises:
+        ValueError: if every solve failed
+    """
+    ok = numpy.flatnonzero(table["converged"])
+    if len(ok):
+        i = ok[numpy.argmin(numpy.asarray(table["seconds"])[ok])]
+    elif numpy.all(numpy.isnan(table["precision"])):
+        raise ValueError("No solve succeeded")
+    else:
+        i = numpy.nanargmin(table["precision"])
+    return PKDict(
+        index=int(i),
+        prec=float(table["prec"][i]),
+        max_iter=int(table["max_iter"][i]),
+        method=int(table["method"][i]),
+    )
+
+
+def _batch_job(dump, solve, f_type, points):
+    # runs in a separate process, on its own copy of the geometry, which is
+    # freed before the process takes the next job
+    t = time.perf_counter()
+    g = radia.UtiDmpPrs(dump)
+    try:
+        s = None if solve is None else list(radia.Solve(g, *solve))
+        if f_type == FIELD_TYPE_MAG_M:
+            m = numpy.reshape(numpy.asarray(radia.ObjM(g), dtype=float), (-1, 2, 3))
+            points, v = m[:, 0], m[:, 1]
+        else:
+            v = _to_xyz(radia.Fld(g, f_type, _radia_path(points)))
+    finally:
+        radia.UtiDelAll()
+    return dict(solve=s, points=points, field=v, seconds=time.perf_counter() - t)
+
+
+def _set_magnetization(elements, magnetization):
+    for e, m in zip(elements, magnetization):
+        radia.ObjSetM(e, [float(x) for x in m])
+
+
+def _sweep_job(builder, dump, solve, probe):
+    # runs in a separate process, on a new geometry; only the solve is timed
+    radia.UtiDelAll()
+    g = builder() if dump is None else radia.UtiDmpPrs(dump)
+    t = time.perf_counter()
+    try:
+        s = list(radia.Solve(g, *solve))
+    except RuntimeError as e:
+        return dict(error=str(e), solve=None, probe=None, seconds=None)
+    t = time.perf_counter() - t
+    return dict(
+        error=None,
+        solve=s,
+        probe=(
+            None
+            if probe is None
+            else _to_xyz(radia.Fld(g, probe[0], _radia_path(probe[1])))
+        ),
+        seconds=t,
+    )
+
+
+def _pool_field(f_type, points):
+    return _to_xyz(radia.Fld(_pool_geom, f_type, points.ravel().tolist()))
+
+
+def _pool_init(dump):
+    global _pool_geom
+    _pool_geom = radia.UtiDmpPrs(dump)
+
+
+def _process_pool(num_workers=None, **kwargs):
+    # radia is not fork safe once the manager's worker thread is running, so
+    # the processes are spawned
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=num_workers or os.cpu_count(),
+        mp_context=multiprocessing.get_context("spawn"),
+        **kwargs,
+    )
+
+
+class FieldPool:
+    """Processes that each restore a copy of a dumped radia geometry and
+    evaluate fields on it
+
+    Args:
+        dump (bytes): output of radia.UtiDmp(geom, "bin")
+        num_workers (int, optional): number of processes (default: all cores)
+    """
+
+    def __init__(self, dump, num_workers=None):
+        self.num_workers = num_workers or os.cpu_count()
+        self._pool = _process_pool(
+            self.num_workers, initializer=_pool_init, initargs=(dump,)
+        )
+
+    def close(self):
+        self._pool.shutdown()
+
+    def field(self, f_type, points):
+        """Evaluates a field across the processes
+
+        Args:
+            f_type (str): field type
+            points (ndarray): positions, flattened or (N, 3)
+        Returns:
+            ndarray: (N, 3) field values in the same order as the points
+        """
+        p = _to_xyz(points)
+        if not len(p):
+            return numpy.empty((0, 3))
+        n = min(
+            len(p),
+            max(
+                self.num_workers * FIELD_POOL_CHUNKS_PER_WORKER,
+                math.ceil(len(p) / FIELD_CHUNK),
+            ),
+        )
+        # map returns results in the order submitted
+        return numpy.concatenate(
+            list(self._pool.map(_pool_field, [f_type] * n, numpy.array_split(p, n)))
+        )
+
+
+class SolveCache:
+    """Magnetization of solved geometries on disk, found by the contents of
+    the geometry before solving and the solve parameters. The least recently
+    used are removed once the files exceed max_bytes
+
+    Args:
+        directory (str): where the files are kept; created if missing
+        max_bytes (int): disk budget
+    """
+
+    def __init__(self, directory, max_bytes=SOLVE_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def clear(self):
+        for k in self._keys():
+            self._discard(k)
+
+    def get(self, key):
+        """
+        Args:
+            key (str): see key()
+        Returns:
+            PKDict: magnetization ((N, 3) array, of each element of the solved
+            geometry) and result (of radia.Solve()), or None
+        """
+        try:
+            with open(self._path(key, "json")) as f:
+                r = json.load(f)
+            m = numpy.load(self._path(key, "npy"))
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # the modification time orders entries for eviction
+        os.utime(self._path(key, "npy"))
+        return PKDict(magnetization=m, result=r["result"])
+
+    def key(self, dump, prec, max_iter, method):
+        """
+        Args:
+            dump (bytes): radia.UtiDmp() of the geometry before solving
+            prec (float): precision
+            max_iter (int): maximum number of iterations
+            method (int): radia solver method
+        Returns:
+            str: key of the solved geometry
+        """
+        h = hashlib.sha256(dump)
+        h.update(json.dumps([float(prec), int(max_iter), int(method)]).encode())
+        return h.hexdigest()
+
+    def put(self, key, magnetization, result):
+        """
+        Args:
+            key (str): see key()
+            magnetization (ndarray): (N, 3) M of each element of the solved
+                geometry, in the order of radia.ObjM()
+            result (list): output of radia.Solve()
+        """
+        # the magnetization is written last, so an entry is complete once it
+        # exists
+        for e, m, v in (
+            ("json", "w", json.dumps(PKDict(result=list(result)))),
+            ("npy", "wb", None),
+        ):
+            t = self._path(key, e + ".tmp")
+            with open(t, m) as f:
+                if v is None:
+                    numpy.save(f, numpy.asarray(magnetization, dtype=float))
+                else:
+                    f.write(v)
+            os.replace(t, self._path(key, e))
+        e = sorted(self._keys(), key=lambda k: os.path.getmtime(self._path(k, "npy")))
+        n = sum(self._nbytes(k) for k in e)
+        # an entry larger than the whole budget is not kept either
+        while n > self.max_bytes and e:
+            k = e.pop(0)
+            n -= self._nbytes(k)
+            self._discard(k)
+            self.evictions += 1
+
+    def stats(self):
+        k = self._keys()
+        return PKDict(
+            entries=len(k),
+            evictions=self.evictions,
+            hits=self.hits,
+            max_bytes=self.max_bytes,
+            misses=self.misses,
+            nbytes=sum(self._nbytes(x) for x in k),
+        )
+
+    def _discard(self, key):
+        for e in ("npy", "json"):
+            try:
+                os.remove(self._path(key, e))
+            except FileNotFoundError:
+                pass
+
+    def _keys(self):
+        return [
+            f[: -len(".npy")] for f in os.listdir(self.directory) if f.endswith(".npy")
+        ]
+
+    def _nbytes(self, key):
+        return sum(os.path.getsize(self._path(key, e)) for e in ("npy", "json"))
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, "{}.{}".format(key, ext))
+
+
 class RadiaGeomMgr:
     """Manager for multiple geometries (Radia objects)"""
 
-    def _get_all_geom(self, geom):
-        g_arr = []
-        for g in radia.ObjCntStuf(geom):
-            if len(radia.ObjCntStuf(g)) > 0:
-                g_arr.extend(self._get_all_geom(g))
-            else:
-                g_arr.append(g)
-        return g_arr
+    def _field_pool(self, name, num_workers):
+        k = (self.get_geom(name), self.get_generation(name), num_workers)
+        if self._pool_key != k:
+            self.close_field_pool()
+            self._pool = FieldPool(
+                self._radia(radia.UtiDmp, k[0], "bin"), num_workers=num_workers
+            )
+            self._pool_key = k
+        return self._pool
+
+    def _field_key(self, name, f_type, points=None, digest=None):
+        # digest is the hash of the points, when they are shared across keys
+        g_id = self.get_geom(name)
+        if digest is None and points is not None:
+            digest = hashlib.sha1(numpy.ascontiguousarray(points)).hexdigest()
+        return (g_id, f_type, digest, self._generations.get(g_id, 0))
+
+    def _mag_groups(self, name, num_elements):
+        # top-level container of each row of radia.ObjM, which lists the
+        # elements depth first in container order, like the tree's leaves
+        t = self._geom_structure(name)
+
+        def _count(g):
+            return sum(_count(m) for m in t.children[g]) if g in t.children else 1
+
+        c = t.children.get(self.get_geom(name))
+        if not c:
+            return None
+        n = [_count(m) for m in c]
+        if sum(n) != num_elements:
+            return None
+        return numpy.repeat(numpy.arange(len(c)), n)
+
+    def _radia(self, fn, *args):
+        # radia is not thread safe - while a background job owns it, wait in
+        # line behind that job instead of calling it from this thread
+        f = self._last_job
+        if f is None or f.done() or threading.current_thread() is self._worker:
+            return fn(*args)
+        return self.submit(fn, *args).result()
+
+    def _restore_magnetization(self, name, magnetization):
+        # sets the elements of the geometry to a solved state, in place, so
+        # the geometry and any container holding it see the solution. False
+        # if the geometry's elements do not match
+        e = self._geom_structure(name).leaves
+        if len(e) != len(magnetization):
+            return False
+        self._radia(_set_magnetization, e, magnetization)
+        return True
+
+    def _run_batch_pool(self, jobs, num_workers):
+        d = PKDict()
+        for j in jobs:
+            if j.name not in d:
+                d[j.name] = self._radia(radia.UtiDmp, self.get_geom(j.name), "bin")
+        with _process_pool(num_workers) as p:
+            f = [
+                p.submit(_batch_job, d[j.name], j.solve, j.f_type, j.points)
+                for j in jobs
+            ]
+            return [
+                PKDict(name=j.name, f_type=j.f_type, **x.result())
+                for j, x in zip(jobs, f)
+            ]
+
+    def _sharing_geoms(self, name):
+        # radia ids of the managed geometries whose trees have an object in
+        # common with name's, which includes containers of it and its members
+        def _objects(n):
+            t = self._geom_structure(n)
+            return set(t.children).union(t.leaves)
+
+        o = _objects(name)
+        res = {self.get_geom(name)}
+        for n in self._geoms:
+            g = self.get_geom(n)
+            if g not in res and not o.isdisjoint(_objects(n)):
+                res.add(g)
+        return res
+
+    def _solve(self, g, prec, max_iter, method, chunk, cancel):
+        if chunk is None:
+            return self._radia(radia.Solve, g, prec, max_iter, method)
+        # radia.Solve builds the interaction matrix each time it is called, so
+        # it is built once here and the chunks relax with it. Each chunk
+        # continues from the magnetization left by the previous one
+        intrc = self._radia(radia.RlxPre, g)
+        try:
+            n = 0
+            while True:
+                c = min(chunk, max_iter - n)
+                res = list(
+                    self._radia(radia.RlxAuto, intrc, prec, c, method, "ZeroM->False")
+                )
+                n += int(res[3])
+                # fewer iterations than allowed means the solution converged
+                if res[3] < c or n >= max_iter or (cancel and cancel.is_set()):
+                    break
+        finally:
+            self._radia(radia.UtiDel, intrc)
+        res[3] = n
+        return res
+
+    def _set_worker(self):
+        self._worker = threading.current_thread()
+
+    def _bump_generation(self, g_id):
+        self._generations[g_id] = self._generations.get(g_id, 0) + 1
+        self._field_cache.remove_if(lambda k: k[0] == g_id)
+        self._render_cache.remove_if(lambda k: k[0] == g_id)
+
+    def _geom_structure(self, name):
+        # children, leaves and parent of get_geom_tree(), without the draw
+        # data: one ObjCntStuf call per node
+        g_id = self.get_geom(name)
+        k = (g_id, "structure", self.get_generation(name))
+        t = self._render_cache.get(k)
+        if t is not None:
+            return t
+        t = PKDict(children=PKDict(), leaves=[], parent=PKDict())
+        s = [g_id]
+        while s:
+            g = s.pop()
+            c = list(self._radia(radia.ObjCntStuf, g))
+            if not c:
+                t.leaves.append(g)
+                continue
+            t.children[g] = c
+            t.parent.update((m, g) for m in c)
+            # depth first, in container order
+            s.extend(reversed(c))
+        return self._render_cache.put(k, t)
+
+    def _geom_tree(self, name):
+        # one ObjDrwVTK call per drawn object
+        g_id = self.get_geom(name)
+        t = PKDict(
+            self._geom_structure(name),
+            bounds=self._radia(radia.ObjGeoLim, g_id),
+            draw=PKDict(),
+            object_bounds=PKDict(),
+            parts=[g_id],
+            vertex_counts=PKDict(),
+        )
+
+        def _draw(g):
+            if g not in t.draw:
+                d = vtk_to_data(self._radia(radia.ObjDrwVTK, g, "Axes->No"))
+                v = numpy.reshape(d.polygons.vertices, (-1, 3))
+                t.draw[g] = d
+                t.object_bounds[g] = (
+                    numpy.stack((v.min(axis=0), v.max(axis=0)), axis=1).ravel().tolist()
+                    if len(v)
+                    else t.bounds
+                )
+                t.vertex_counts[g] = len(v)
+            return t.vertex_counts[g]
+
+        n = _draw(g_id)
+        if t.leaves == [g_id]:
+            return t
+        # if the number of vertices of the container is more than the total
+        # across its elements, a symmetry or other "additive" transformation has
+        # been applied and we cannot get at the individual elements. Fall back
+        # to the container's direct members, in case it is applied below them
+        for p in (t.leaves, t.children[g_id]):
+            if n <= sum(_draw(g) for g in p):
+                t.parts = list(p)
+                break
+        return t
 
     def add_geom(self, name, geom):
-        self._geoms[name] = PKDict(g=geom, solved=False)
+        self._geoms[name] = PKDict(g=geom, solved=False, solve=None)
+        self._bump_generation(geom)
 
     # path is *flattened* array of positions in space ([x1, y1, z1,...xn, yn, zn])
     def get_field(self, name, f_type, path):
-        pv_arr = []
-        p = numpy.reshape(path, (-1, 3)).tolist()
-        b = []
-        # get every component
-        f = radia.Fld(self.get_geom(name), f_type, path)
-        b.extend(f)
-        b = numpy.reshape(b, (-1, 3)).tolist()
-        for p_idx, pt in enumerate(p):
-            pv_arr.append([pt, b[p_idx]])
-        return pv_arr
+        return self.get_field_array(name, f_type, path).tolist()
+
+    def compare_fields(self, names, f_type, path):
+        """Evaluates one field of several geometries at the same points,
+        reusing cached values
+
+        Args:
+            names (list): names of the geometries
+            f_type (str): field type, other than M
+            path (list): flattened positions ([x1, y1, z1,...xn, yn, zn])
+        Returns:
+            PKDict: points ((N, 3) array), and per geometry name: field ((N, 3)
+            read-only arrays, shared with the field cache), seconds and cached
+            (whether the field was in the cache)
+        Raises:
+            ValueError: if f_type is M or invalid
+        """
+        if f_type not in POINT_FIELD_TYPES:
+            raise ValueError("Invalid field {} ({})".format(f_type, POINT_FIELD_TYPES))
+        p = _to_xyz(path)
+        d = hashlib.sha1(numpy.ascontiguousarray(p)).hexdigest()
+        r = None
+        res = PKDict(points=p, field=PKDict(), seconds=PKDict(), cached=PKDict())
+        for n in names:
+            t = time.perf_counter()
+            k = self._field_key(n, f_type, digest=d)
+            f = self._field_cache.get(k)
+            res.cached[n] = f is not None
+            if f is None:
+                if r is None:
+                    r = _radia_path(p)
+                f = self._field_cache.put(
+                    k, _to_xyz(self._radia(radia.Fld, self.get_geom(n), f_type, r))
+                )
+            # a view, so that the cached array cannot be modified through it
+            res.field[n] = f.view()
+            res.field[n].flags.writeable = False
+            res.seconds[n] = time.perf_counter() - t
+        return res
+
+    # same as get_field, but returns an (N, 2, 3) array of [point, value] pairs
+    def get_field_array(self, name, f_type, path):
+        p = _to_xyz(path)
+        k = self._field_key(name, f_type, p)
+        f = self._field_cache.get(k)
+        if f is None:
+            f = self._field_cache.put(
+                k,
+                _to_xyz(
+                    self._radia(radia.Fld, self.get_geom(name), f_type, _radia_path(p))
+                ),
+            )
+        return numpy.stack((p, f), axis=1)
+
+    def export_field(
+        self, name, f_type, f, path=None, fmt=None, chunk_size=FIELD_CHUNK
+    ):
+        """Writes a field map, or the magnetization of each element, to a file
+        that loads without radia (see field_export.load()). The field is
+        evaluated and written a chunk at a time
+
+        Args:
+            name (str): name of the geometry
+            f_type (str): field type
+            f (str or file): path or file-like object; .h5 or .hdf5 for HDF5
+            path (list): flattened positions ([x1, y1, z1,...xn, yn, zn]),
+                ignored for M
+            fmt (str, optional): one of field_export.FORMATS
+            chunk_size (int): maximum number of points per chunk
+        """
+        if f_type == FIELD_TYPE_MAG_M:
+            m = self.get_magnetization_array(name)
+            n = len(m)
+            c = ((i, m[i : i + chunk_size]) for i in range(0, n, chunk_size))
+        else:
+            p = _to_xyz(path)
+            n = len(p)
+            c = self.iter_field(name, f_type, p, chunk_size=chunk_size, cache=False)
+        with field_export.Writer(
+            f, n, self.export_metadata(name, f_type), fmt=fmt
+        ) as w:
+            for _, b in c:
+                w.write(b)
+
+    def export_metadata(self, name, f_type):
+        """Description of a field map of a geometry as it is now, for
+        field_export
+
+        Args:
+            name (str): name of the geometry
+            f_type (str): field type
+        Returns:
+            PKDict: name, f_type, units, bounds ([xmin, xmax, ymin,...]) and
+            solve (prec, max_iter, method and result of the last solve, or None)
+        """
+        return PKDict(
+            name=name,
+            f_type=f_type,
+            units=FIELD_UNITS[f_type],
+            bounds=list(self._radia(radia.ObjGeoLim, self.get_geom(name))),
+            solve=self._geoms[name].solve,
+        )
+
+    def field_cache_stats(self):
+        return self._field_cache.stats()
+
+    def invalidate(self, name):
+        """Discards cached data for a geometry after it has been modified
+        outside the manager, and for every managed geometry that shares
+        objects with it
+
+        Args:
+            name (str): name of the geometry
+        """
+        g_id = self.get_geom(name)
+        # first, so that its members are read again
+        self._bump_generation(g_id)
+        for g in self._sharing_geoms(name) - {g_id}:
+            self._bump_generation(g)
+
+    def iter_field(self, name, f_type, path, chunk_size=FIELD_CHUNK, cache=True):
+        """Evaluates a field a chunk of points at a time, so that radia's input
+        and output are never larger than the chunk
+
+        Args:
+            name (str): name of the geometry
+            f_type (str): field type
+            path (list): flattened positions ([x1, y1, z1,...xn, yn, zn])
+            chunk_size (int): maximum number of points per radia.Fld() call
+            cache (bool): keep the complete result in the field cache, which
+                holds the whole field in memory
+        Yields:
+            tuple: index of the first point in the chunk, and an (n, 2, 3) array
+            of [point, value] pairs
+        """
+        g = self.get_geom(name)
+        p = _to_xyz(path)
+        k = self._field_key(name, f_type, p)
+        f = self._field_cache.get(k)
+        if f is not None:
+            for i in range(0, len(p), chunk_size):
+                yield i, numpy.stack(
+                    (p[i : i + chunk_size], f[i : i + chunk_size]), axis=1
+                )
+            return
+        if not cache:
+            for i in range(0, len(p), chunk_size):
+                c = p[i : i + chunk_size]
+                yield i, numpy.stack(
+                    (c, _to_xyz(self._radia(radia.Fld, g, f_type, c.ravel().tolist()))),
+                    axis=1,
+                )
+            return
+        f = numpy.empty(p.shape)
+        for i in range(0, len(p), chunk_size):
+            c = p[i : i + chunk_size]
+            f[i : i + len(c)] = _to_xyz(
+                self._radia(radia.Fld, g, f_type, c.ravel().tolist())
+            )
+            yield i, numpy.stack((c, f[i : i + len(c)]), axis=1)
+        # only complete results are cached
+        self._field_cache.put(k, f)
+
+    def close_field_pool(self):
+        """Stops the processes used by get_field_parallel()"""
+        if self._pool is not None:
+            self._pool.close()
+        self._pool = None
+        self._pool_key = None
+
+    def get_field_parallel(self, name, f_type, path, num_workers=None):
+        """Same as get_field_array, but split across processes. The geometry is
+        dumped once and the processes are reused until its version changes
+
+        Args:
+            name (str): name of the geometry
+            f_type (str): field type
+            path (list): flattened positions ([x1, y1, z1,...xn, yn, zn])
+            num_workers (int, optional): number of processes (default: all cores)
+        Returns:
+            ndarray: (N, 2, 3) array of [point, value] pairs
+        """
+        p = _to_xyz(path)
+        k = self._field_key(name, f_type, p)
+        f = self._field_cache.get(k)
+        if f is None:
+            f = self._field_cache.put(
+                k, self._field_pool(name, num_workers).field(f_type, p)
+            )
+        return numpy.stack((p, f), axis=1)
 
     def get_magnetization(self, name):
-        return radia.ObjM(self.get_geom(name))
+        return self.get_magnetization_array(name).tolist()
+
+    # same as get_magnetization, but returns an (N, 2, 3) array of [center, M] pairs
+    def get_magnetization_array(self, name):
+        k = self._field_key(name, FIELD_TYPE_MAG_M)
+        m = self._field_cache.get(k)
+        if m is None:
+            m = numpy.reshape(
+                numpy.asarray(
+                    self._radia(radia.ObjM, self.get_geom(name)), dtype=float
+                ),
+                (-1, 2, 3),
+            )
+            # the cached array is shared with callers
+            m.flags.writeable = False
+            self._field_cache.put(k, m)
+        return m
+
+    def get_magnetization_view(self, name, aggregation, max_vectors, voxel_size=None):
+        """Magnetization drawn with at most max_vectors vectors (see
+        mag_lod.reduce()). get_magnetization_array() has every element
+
+        Args:
+            name (str): name of the geometry
+            aggregation (str): one of mag_lod.AGGREGATIONS
+            max_vectors (int): budget
+            voxel_size (float, optional): edge length of the voxels, when
+                aggregating by voxel; by default sized to the budget
+        Returns:
+            PKDict: vectors ((K, 2, 3) [center, M] pairs) and members (the
+            vector each element is drawn as, or -1)
+        """
+        k = self._field_key(name, FIELD_TYPE_MAG_M) + (
+            aggregation,
+            max_vectors,
+            voxel_size,
+        )
+        v = self._field_cache.get(k)
+        if v is not None:
+            return v
+        m = self.get_magnetization_array(name)
+        return self._field_cache.put(
+            k,
+            mag_lod.reduce(
+                m,
+                aggregation,
+                max_vectors,
+                groups=(
+                    self._mag_groups(name, len(m))
+                    if aggregation == mag_lod.AGGREGATION_CONTAINER
+                    and len(m) > max_vectors
+                    else None
+                ),
+                voxel_size=voxel_size,
+            ),
+        )
+
+    def render_cache_stats(self):
+        return self._render_cache.stats()
+
+    def solve_cache_stats(self):
+        return None if self._solve_cache is None else self._solve_cache.stats()
+
+    def run_batch(self, jobs, num_workers=0):
+        """Solves geometries and computes fields without a viewer
+
+        Each job is a dict of name (of a geometry added to the manager),
+        f_type (field type), points (positions, for fields other than M) and,
+        optionally, solve (dict of prec, max_iter and method).
+
+        With num_workers = 0 the jobs run in order on the manager's
+        geometries, so a solve carries over to later jobs and the fields are
+        cached. Otherwise each job runs in one of num_workers processes on a
+        copy of its geometry as it is now, so solves are independent of each
+        other and leave the manager's geometries unchanged.
+
+        Args:
+            jobs (list): job dicts
+            num_workers (int): number of processes
+        Returns:
+            list: per job, in order, PKDict of name, f_type, solve (radia
+            result or None), points and field ((N, 3) arrays; element
+            centers for M) and seconds. See batch_columns() and
+            RadiaViewer.show_result()
+        """
+        jobs = [PKDict(j) for j in jobs]
+        for j in jobs:
+            if j.f_type not in FIELD_TYPES:
+                raise ValueError("Invalid field {} ({})".format(j.f_type, FIELD_TYPES))
+            j.points = None if j.f_type == FIELD_TYPE_MAG_M else _to_xyz(j.points)
+            j.solve = (
+                None
+                if j.get("solve") is None
+                else (j.solve["prec"], j.solve["max_iter"], j.solve.get("method", 0))
+            )
+        if num_workers > 0:
+            return self._run_batch_pool(jobs, num_workers)
+        res = []
+        for j in jobs:
+            t = time.perf_counter()
+            s = None if j.solve is None else list(self.solve(j.name, *j.solve))
+            if j.f_type == FIELD_TYPE_MAG_M:
+                a = self.get_magnetization_array(j.name)
+            else:
+                a = self.get_field_array(j.name, j.f_type, j.points)
+            res.append(
+                PKDict(
+                    name=j.name,
+                    f_type=j.f_type,
+                    solve=s,
+                    points=a[:, 0],
+                    field=a[:, 1],
+                    seconds=time.perf_counter() - t,
+                )
+            )
+        return res
+
+    def solve(self, name, prec, max_iter, method, chunk=None, cancel=None):
+        """Runs radia.Solve() on a geometry
+
+        With a solve cache (see solve_cache_dir), a geometry that has been
+        solved with the same parameters before gets the cached magnetization
+        of its elements instead (radia.ObjSetM)
+
+        Args:
+            name (str): name of the geometry
+            prec (float): precision
+            max_iter (int): maximum number of iterations
+            method (int): radia solver method
+            chunk (int, optional): solve in steps of at most this many iterations
+            cancel (threading.Event, optional): when set, stop after the current step
+        Returns:
+            list: the radia result [precision, max |M|, max |H|, iterations]
+        """
+        g = self.get_geom(name)
+        try:
+            c = None
+            if self._solve_cache is not None:
+                k = self._solve_cache.key(
+                    self._radia(radia.UtiDmp, g, "bin"), prec, max_iter, method
+                )
+                c = self._solve_cache.get(k)
+            if c is not None and self._restore_magnetization(name, c.magnetization):
+                res = c.result
+            else:
+                res = self._solve(g, prec, max_iter, method, chunk, cancel)
+                # a cancelled solve is not complete
+                if self._solve_cache is not None and not (cancel and cancel.is_set()):
+                    self._solve_cache.put(
+                        k,
+                        numpy.reshape(
+                            numpy.asarray(self._radia(radia.ObjM, g), dtype=float),
+                            (-1, 2, 3),
+                        )[:, 1],
+                        res,
+                    )
+            self._geoms[name].solved = True
+            self._geoms[name].solve = PKDict(
+                prec=prec, max_iter=max_iter, method=method, result=list(res)
+            )
+            return res
+        finally:
+            # even a failed or cancelled solve changes the magnetization
+            self.invalidate(name)
+
+    def sweep_solve(self, grid, name=None, builder=None, probe=None, num_workers=None):
+        """Solves a geometry with every combination of solve parameters, each
+        on a new copy of the geometry in one of num_workers processes
+
+        Args:
+            grid (dict): lists of prec, max_iter and method values. A missing
+                method is 0
+            name (str, optional): geometry to copy as it is now
+            builder (callable, optional): instead of name, a module level
+                function that creates the geometry and returns its radia id,
+                called in each process
+            probe (dict, optional): f_type and points at which to evaluate the
+                field after each solve
+            num_workers (int, optional): number of processes (default: all cores)
+        Returns:
+            PKDict: equal length columns, one row per combination: prec,
+            max_iter, method, precision, max_m, max_h, iterations (the radia
+            result), converged (fewer iterations than max_iter), seconds (of
+            the solve), error (message, if radia failed) and, with a probe,
+            field ((runs, N, 3) array). See sweep_best()
+        Raises:
+            ValueError: unless exactly one of name and builder is given
+        """
+        if (name is None) == (builder is None):
+            raise ValueError("sweep_solve requires one of name or builder")
+        d = (
+            None
+            if name is None
+            else self._radia(radia.UtiDmp, self.get_geom(name), "bin")
+        )
+        p = None
+        if probe is not None:
+            if probe["f_type"] not in POINT_FIELD_TYPES:
+                raise ValueError(
+                    "Invalid field {} ({})".format(probe["f_type"], POINT_FIELD_TYPES)
+                )
+            p = (probe["f_type"], _to_xyz(probe["points"]))
+        runs = list(
+            itertools.product(grid["prec"], grid["max_iter"], grid.get("method", [0]))
+        )
+        with _process_pool(num_workers) as e:
+            res = [
+                x.result()
+                for x in [e.submit(_sweep_job, builder, d, r, p) for r in runs]
+            ]
+        s = numpy.array(
+            [r["solve"] or [numpy.nan] * 4 for r in res], dtype=float
+        ).reshape(-1, 4)
+        t = PKDict(
+            prec=numpy.array([r[0] for r in runs], dtype=float),
+            max_iter=numpy.array([r[1] for r in runs], dtype=int),
+            method=numpy.array([r[2] for r in runs], dtype=int),
+            precision=s[:, 0],
+            max_m=s[:, 1],
+            max_h=s[:, 2],
+            iterations=s[:, 3],
+            seconds=numpy.array(
+                [numpy.nan if r["seconds"] is None else r["seconds"] for r in res]
+            ),
+            error=[r["error"] for r in res],
+        )
+        t.converged = t.iterations < t.max_iter
+        if p is not None:
+            t.field = numpy.array(
+                [
+                    (
+                        numpy.full(p[1].shape, numpy.nan)
+                        if r["probe"] is None
+                        else r["probe"]
+                    )
+                    for r in res
+                ]
+            )
+        return t
+
+    def solve_async(self, name, prec, max_iter, method, chunk=SOLVE_CHUNK, cancel=None):
+        """Solves on the radia worker thread. See solve()
+
+        Returns:
+            concurrent.futures.Future: resolves to the radia result
+        """
+        return self.submit(
+            self.solve, name, prec, max_iter, method, chunk=chunk, cancel=cancel
+        )
+
+    def submit(self, fn, *args, **kwargs):
+        """Queues a job on the single thread that runs radia in the background.
+        Radia calls made through the manager wait for queued jobs to finish
+
+        Returns:
+            concurrent.futures.Future: the result of fn
+        """
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="radia",
+                initializer=self._set_worker,
+            )
+        self._last_job = self._executor.submit(fn, *args, **kwargs)
+        return self._last_job
 
     def is_geom_solved(self, name):
-        return self.get_geom(name).solved
+        return self._geoms[name].solved
 
     # define send to satisfy RSDebugger - get web socket somehow instead?
     def send(self, msg):
         pkdp(msg)
 
-    def vector_field_to_data(self, name, pv_arr, units):
-        # format is [[[px, py, pz], [vx, vy, vx]], ...]
-        # convert to webGL object
-
+    def vector_field_to_data(self, name, pv_arr, units, points=None):
+        # format is [[[px, py, pz], [vx, vy, vx]], ...] or an equivalent array
+        # convert to webGL object (see vectors_to_data)
         v_data = gui_utils.new_geom_object()
-        v_data.vectors.lengths = []
-        v_data.vectors.colors = []
-        v_max = 0.0
-        v_min = sys.float_info.max
-        for i in range(len(pv_arr)):
-            p = pv_arr[i][0]
-            v = pv_arr[i][1]
-            n = linalg.norm(v)
-            v_max = max(v_max, n)
-            v_min = min(v_min, n)
-            nv = (numpy.array(v) / (n if n > 0 else 1.0)).tolist()
-            v_data.vectors.vertices.extend(p)
-            v_data.vectors.directions.extend(nv)
-            v_data.vectors.magnitudes.append(n)
-        v_data.vectors.range = [v_min, v_max]
-        v_data.vectors.units = units
-
-        geom_data = self.geom_to_data(name, divide=False)
-        l_data = geom_data.data[0]
+        v_data.vectors = vectors_to_data(pv_arr, units, points=points)
 
-        # temp color set - will move to client
-        for c_idx, c in enumerate(l_data.lines.colors):
-            l_data.lines.colors[c_idx] = 0.85
-        v_data.lines.vertices.extend(l_data.lines.vertices)
-        v_data.lines.lengths.extend(l_data.lines.lengths)
-        v_data.lines.colors.extend(l_data.lines.colors)
+        o = self.get_outline(name)
+        # shared with other field views of this geometry version - do not modify
+        v_data.lines = o.lines
 
         return PKDict(
             name=name + ".Field",
             id=self.get_geom(name),
             data=[v_data],
-            bounds=geom_data.bounds,
+            bounds=o.bounds,
+            outline=o.key,
         )
 
-    def geom_to_data(self, name=None, divide=True):
-        # TODO(mvk): if no color, get color from parent if any?
+    def geom_to_data(self, name=None, divide=True, max_polygons=None):
+        """Draw data of a geometry, divided into the objects of get_geom_tree()
+
+        Args:
+            name (str): name of the geometry
+            divide (bool): one element per object rather than one in all
+            max_polygons (int, optional): draw about this many polygons at
+                most (see geom_lod.reduce). Individual objects at full detail
+                are available from get_geom_object_data()
+        Returns:
+            PKDict: name, id, data (geometry objects) and bounds
+        """
         g_id = self.get_geom(name)
-        n = (name if name is not None else str(g_id)) + ".Geom"
-        pd = PKDict(name=n, id=g_id, data=[])
-        d = to_pkdict(radia.ObjDrwVTK(g_id, "Axes->No"))
-        n_verts = len(d.polygons.vertices)
-        c = radia.ObjCntStuf(g_id)
-        l = len(c)
-        if not divide or l == 0:
-            pd.data = [d]
-        else:
-            d_arr = []
-            n_s_verts = 0
-            # for g in get_geom_tree(g_id):
-            for g in c:
-                # for fully recursive array
-                # for g in get_all_geom(geom):
-                s_d = to_pkdict(radia.ObjDrwVTK(g, "Axes->No"))
-                n_s_verts += len(s_d.polygons.vertices)
-                d_arr.append(s_d)
-            # if the number of vertices of the container is more than the total
-            # across its elements, a symmetry or other "additive" transformation has
-            # been applied and we cannot get at the individual elements
-            if n_verts > n_s_verts:
-                d_arr = [d]
-            pd.data = d_arr
-        pd.bounds = radia.ObjGeoLim(g_id)
-        return pd
+        t = self.get_geom_tree(name)
+        d = [t.draw[g] for g in (t.parts if divide else [g_id])]
+        if max_polygons is not None and geom_lod.num_polygons(d) > max_polygons:
+            k = (g_id, "lod", divide, max_polygons, self.get_generation(name))
+            r = self._render_cache.get(k)
+            d = (
+                r
+                if r is not None
+                else self._render_cache.put(k, geom_lod.reduce(d, max_polygons))
+            )
+        # the cached data is shared - callers must copy before modifying it
+        return PKDict(
+            name=(name if name is not None else str(g_id)) + ".Geom",
+            id=g_id,
+            data=d,
+            bounds=t.bounds,
+        )
 
     def get_geom(self, name):
         return self._geoms[name].g
 
+    def get_generation(self, name):
+        """Current version of a geometry, which changes when it is re-added,
+        solved, or invalidated
+        """
+        return self._generations.get(self.get_geom(name), 0)
+
+    def get_outline(self, name):
+        """Outline of a geometry, drawn under its field vectors. It is computed
+        once per geometry version
+
+        Args:
+            name (str): name of the geometry
+        Returns:
+            PKDict: key (geometry id and generation), bounds, and lines as arrays
+        """
+        g_id = self.get_geom(name)
+        k = (g_id, "outline", self.get_generation(name))
+        o = self._render_cache.get(k)
+        if o is not None:
+            return o
+        d = self.geom_to_data(name, divide=False)
+        l = d.data[0].lines
+        # temp color set - will move to client
+        return self._render_cache.put(
+            k,
+            PKDict(
+                key="{}.{}".format(*k[::2]),
+                bounds=d.bounds,
+                lines=PKDict(
+                    colors=numpy.full(len(l.colors), 0.85, dtype=numpy.float32),
+                    lengths=numpy.asarray(l.lengths, dtype=numpy.int32),
+                    vertices=numpy.asarray(l.vertices, dtype=numpy.float32),
+                ),
+            ),
+        )
+
+    def get_geom_object(self, name, index):
+        """Radia object drawn as one element of the divided geometry, for
+        picking
+
+        Args:
+            name (str): name of the geometry
+            index (int): position in the data of geom_to_data(name)
+        Returns:
+            int: radia object id
+        """
+        return self.get_geom_tree(name).parts[index]
+
+    def get_geom_object_data(self, name, index):
+        """Full detail draw data of one element of the divided geometry
+
+        Args:
+            name (str): name of the geometry
+            index (int): position in the data of geom_to_data(name)
+        Returns:
+            PKDict: geometry object
+        """
+        t = self.get_geom_tree(name)
+        return t.draw[t.parts[index]]
+
+    def get_geom_tree(self, name):
+        """Structure and draw data of a geometry, built once per geometry version.
+        Containers are divided down to their leaves unless a symmetry prevents it
+
+        Args:
+            name (str): name of the geometry
+        Returns:
+            PKDict: bounds, children and parent (by object id), leaves (depth
+            first), parts (objects drawn when divided), and per drawn object:
+            draw (geometry object), object_bounds and vertex_counts
+        """
+        g_id = self.get_geom(name)
+        k = (g_id, "tree", self.get_generation(name))
+        t = self._render_cache.get(k)
+        if t is None:
+            t = self._render_cache.put(k, self._geom_tree(name))
+        return t
+
     def get_geom_list(self):
         return [n for n in self._geoms]
 
@@ -172,5 +1329,24 @@ class RadiaGeomMgr:
             g = self.get_geom(g_name)
             ctr["geoms"].append(g)
 
-    def __init__(self):
+    def __init__(
+        self,
+        render_cache_bytes=RENDER_CACHE_BYTES,
+        field_cache_bytes=FIELD_CACHE_BYTES,
+        solve_cache_dir=None,
+        solve_cache_bytes=SOLVE_CACHE_BYTES,
+    ):
         self._geoms = PKDict({})
+        self._executor = None
+        self._field_cache = LRUCache(field_cache_bytes)
+        self._generations = PKDict()
+        self._last_job = None
+        self._pool = None
+        self._pool_key = None
+        self._render_cache = LRUCache(render_cache_bytes)
+        self._solve_cache = (
+            None
+            if solve_cache_dir is None
+            else SolveCache(solve_cache_dir, solve_cache_bytes)
+        )
+        self._worker = None
@@ -1,4 +1,8 @@
 from ._version import NPM_PACKAGE_RANGE
+from jupyter_rs_radia import field_export
+from jupyter_rs_radia import field_paths
+from jupyter_rs_radia import gui_utils
+from jupyter_rs_radia import mag_lod
 from jupyter_rs_radia import radia_tk
 from jupyter_rs_vtk import vtk_viewer
 from pykern import pkdebug
@@ -6,19 +10,59 @@ from pykern import pkio
 from pykern import pkjson
 from pykern import pkresource
 from pykern.pkcollections import PKDict
-from traitlets import Dict, List, Unicode
+from traitlets import Bool, Dict, Float, Int, List, Unicode
+import asyncio
+import collections
+import contextlib
 import datetime
+import io
 import ipywidgets
 import math
-import radia
+import numpy
+import threading
+import time
 
 AXES = ["x", "y", "z"]
 
+COMPARE_DIFFERENCE = "difference"
+COMPARE_OVERLAY = "overlay"
+COMPARE_MODES = [COMPARE_OVERLAY, COMPARE_DIFFERENCE]
+
 PATH_TYPE_CIRCLE = "Circle"
 PATH_TYPE_FILE = "File"
+PATH_TYPE_GRID = "Grid"
 PATH_TYPE_LINE = "Line"
 PATH_TYPE_MANUAL = "Manual"
-PATH_TYPES = [PATH_TYPE_LINE, PATH_TYPE_CIRCLE, PATH_TYPE_MANUAL, PATH_TYPE_FILE]
+PATH_TYPE_PLANE = "Plane"
+PATH_TYPES = [
+    PATH_TYPE_LINE,
+    PATH_TYPE_CIRCLE,
+    PATH_TYPE_MANUAL,
+    PATH_TYPE_FILE,
+    PATH_TYPE_GRID,
+    PATH_TYPE_PLANE,
+]
+
+# what a scheduled render redoes, from least to most work
+RENDER_STAGE_LAYOUT = "layout"
+RENDER_STAGE_COLOR_MAP = "color_map"
+RENDER_STAGE_VECTORS = "vectors"
+RENDER_STAGE_GEOMETRY = "geometry"
+RENDER_STAGES = [
+    RENDER_STAGE_LAYOUT,
+    RENDER_STAGE_COLOR_MAP,
+    RENDER_STAGE_VECTORS,
+    RENDER_STAGE_GEOMETRY,
+]
+
+# number of stage timings kept in RadiaViewer.stats
+STATS_SIZE = 1000
+
+# returned by RadiaViewer._timed() when stats are disabled
+_NO_STATS = contextlib.nullcontext()
+
+# vector arrays sent as binary buffers in "vectors" messages
+VECTOR_ARRAYS = ["vertices", "directions", "magnitudes"]
 
 VIEW_TYPE_OBJ = "Objects"
 VIEW_TYPE_FIELD = "Fields"
@@ -37,10 +81,49 @@ def _coord_grp(coords, layout={"width": "48px"}):
     return flds, grp
 
 
+def _count_grp(counts, labels, layout={"width": "48px"}):
+    flds = PKDict()
+    for c_idx, label in enumerate(labels):
+        flds[label] = ipywidgets.BoundedIntText(
+            value=counts[c_idx],
+            min=1,
+            max=100000,
+            layout=layout,
+        )
+    grp = ipywidgets.HBox([_label_grp(flds[l], l) for l in flds])
+    return flds, grp
+
+
 def _label_grp(widget, txt, layout={"padding": "0 6px 0 0"}):
     return ipywidgets.HBox([ipywidgets.Label(txt), widget], layout=layout)
 
 
+def _buffer_nbytes(d):
+    if isinstance(d, memoryview):
+        return d.nbytes
+    if isinstance(d, dict):
+        return sum(_buffer_nbytes(v) for v in d.values())
+    if isinstance(d, list) and d and isinstance(d[0], (dict, list)):
+        return sum(_buffer_nbytes(v) for v in d)
+    return 0
+
+
+def _model_data_to_json(model_data, widget):
+    d = model_data
+    # the outline is synced once per geometry version in its own trait
+    if d.get("outline"):
+        d = PKDict(d)
+        d.data = [PKDict(d.data[0], lines=gui_utils.new_geom_object().lines)]
+    if not widget.binary_transport:
+        if widget.stats_enabled:
+            widget._sent_bytes += radia_tk.data_nbytes(d)
+        return gui_utils.to_lists(d)
+    d = gui_utils.to_binary(d)
+    if widget.stats_enabled:
+        widget._sent_bytes += _buffer_nbytes(d)
+    return d
+
+
 @ipywidgets.register
 class RadiaViewer(ipywidgets.VBox):
     """Jupyter widget for visualizing 3D Radia models.
@@ -56,11 +139,36 @@ class RadiaViewer(ipywidgets.VBox):
     _view_module_version = Unicode(NPM_PACKAGE_RANGE).tag(sync=True)
     _model_module_version = Unicode(NPM_PACKAGE_RANGE).tag(sync=True)
 
+    # send geometry arrays as binary buffers rather than JSON lists
+    binary_transport = Bool(True)
+
     current_geom = Unicode("").tag(sync=True)
-    current_field_points = []
+    current_field_points = None
 
     field_color_map_name = Unicode("").tag(sync=True)
 
+    # about this many polygons at most are drawn for a geometry; see
+    # show_object_detail() for the full detail of one object
+    geom_render_budget = Int(500000)
+
+    # at most this many field vectors are drawn; get_result() has all of them
+    field_render_budget = Int(100000)
+
+    # larger paths are evaluated in chunks of this many points, and the
+    # vectors are sent to the viewer as each chunk finishes
+    field_chunk_size = Int(radia_tk.FIELD_CHUNK)
+
+    # if > 0, larger paths are instead split across this many processes
+    field_workers = Int(0)
+
+    # how magnetization with more elements than field_render_budget is drawn
+    # (see mag_lod.AGGREGATIONS); get_vector_elements() has the elements of
+    # each vector
+    mag_aggregation = Unicode(mag_lod.AGGREGATION_VOXEL)
+
+    # edge length of the voxels when aggregating by voxel; 0 to fit the budget
+    mag_voxel_size = Float(0.0)
+
     file_data = List(default_value=()).tag(sync=True)
 
     client_props = Dict(default_value={}).tag(sync=True)
@@ -73,12 +181,24 @@ class RadiaViewer(ipywidgets.VBox):
 
     field_color_maps = List(default_value=list()).tag(sync=True)
     # use "model_info"?  So we don't have "model_data.data"
-    model_data = Dict(default_value={}).tag(sync=True)
+    model_data = Dict(default_value={}).tag(sync=True, to_json=_model_data_to_json)
     out = ipywidgets.Output(layout={"border": "1px solid black"})
 
+    # geometry outline under the field vectors, only sent when its version changes
+    outline = Dict(default_value={}).tag(sync=True, to_json=_model_data_to_json)
+
+    # run radia.Solve on the manager's worker thread so the notebook stays responsive
+    solve_async = Bool(True)
+
     # sync with js?
     solve_results = None
 
+    # record the time taken by each stage of display() and solves (see stats)
+    stats_enabled = Bool(False)
+
+    # also print each stage timing in the browser's console
+    stats_debug = Bool(False)
+
     title = Unicode("").tag(sync=True)
     vector_scaling = Unicode("").tag(sync=True)
     vector_scaling_types = List(default_value=list()).tag(sync=True)
@@ -118,6 +238,8 @@ class RadiaViewer(ipywidgets.VBox):
                 'Circle'
                 'Manual'
                 'File'
+                'Grid'
+                'Plane'
         Returns:
             Widget: the viewer instance if successful,
             else an Output widget containing an error message
@@ -125,10 +247,17 @@ class RadiaViewer(ipywidgets.VBox):
             KeyError: if no geometry named <g_name> has been added
             ValueError: if v_type, f_type, or p_type are invalid
         """
+        if self._solve_job is not None:
+            # radia is busy - render once the solve finishes
+            self._pending_display = (g_name, v_type, f_type, p_type)
+            return self
         self.out.clear_output()
         self._update_layout()
         self._update_actions()
+        self._rendered_layout = self._get_layout_state()
         self.solve_results = None
+        self._field_state = None
+        self._field_streamed = False
         if g_name is None:
             g_name = self.current_geom
         self.current_geom = g_name
@@ -155,37 +284,237 @@ class RadiaViewer(ipywidgets.VBox):
             )
             # self.rserr('Invalid path {} ({})'.format(p_type, PATH_TYPES))
             return self.out
+        self._stats_call += 1
         if v_type == VIEW_TYPE_OBJ:
-            self.model_data = self.mgr.geom_to_data(g_name)
+            with self._timed("geometry") as r:
+                d = self.mgr.geom_to_data(g_name, max_polygons=self.geom_render_budget)
+            if r is not None:
+                r.vertices = sum(len(o.polygons.vertices) // 3 for o in d.data)
         elif v_type == VIEW_TYPE_FIELD:
-            if f_type == radia_tk.FIELD_TYPE_MAG_M:
-                self.solve_results = self.mgr.get_magnetization(g_name)
-            elif f_type in radia_tk.POINT_FIELD_TYPES:
-                self.solve_results = self.mgr.get_field(
-                    g_name, f_type, self.get_field_points()
+            d = self._field_to_data(g_name, f_type)
+
+        with self._timed("send"):
+            self._rendered_view = self._get_view_state(g_name, v_type, f_type)
+            if d is not None:
+                self._set_scene(d)
+        return self
+
+    def compare(self, names, f_type=None, mode=COMPARE_OVERLAY):
+        """Shows a field of several geometries at the current field points,
+        overlaid, or the difference of two. Changing a control returns to
+        the normal view. The compared fields are only returned, so there is
+        no result (get_result()) to export
+
+        Args:
+            names (list): names of the geometries; two for COMPARE_DIFFERENCE,
+                which shows the first minus the second
+            f_type (str, optional): field type other than M (default: the
+                selected one)
+            mode (str): one of COMPARE_MODES
+        Returns:
+            PKDict: RadiaGeomMgr.compare_fields() result, with the time taken
+            for each geometry
+        Raises:
+            ValueError: if mode, f_type or the number of names is invalid
+        """
+        f_type = self.field_type_list.value if f_type is None else f_type
+        if mode not in COMPARE_MODES:
+            raise ValueError("Invalid mode {} ({})".format(mode, COMPARE_MODES))
+        if mode == COMPARE_DIFFERENCE and len(names) != 2:
+            raise ValueError("Difference requires two geometries")
+        r = self.mgr.compare_fields(names, f_type, self.get_field_points())
+        u = radia_tk.FIELD_UNITS[f_type]
+        self._field_state = None
+        # any control change renders the normal view
+        self._rendered_view = None
+        # not the field of any one geometry
+        self.solve_results = None
+        if mode == COMPARE_DIFFERENCE:
+            d = self.mgr.vector_field_to_data(
+                names[0],
+                self._render_subset(
+                    numpy.stack(
+                        (r.points, r.field[names[0]] - r.field[names[1]]), axis=1
+                    ),
+                    f_type,
+                ),
+                u,
+            )
+            t = " - ".join(names)
+        else:
+            g = [
+                self.mgr.vector_field_to_data(
+                    n,
+                    self._render_subset(
+                        numpy.stack((r.points, r.field[n]), axis=1), f_type
+                    ),
+                    u,
+                )
+                for n in names
+            ]
+            # one color scale across the geometries
+            v = [x.data[0].vectors for x in g]
+            c = [min(x.range[0] for x in v), max(x.range[1] for x in v)]
+            b = numpy.array([x.bounds for x in g]).reshape(len(g), 3, 2)
+            d = PKDict(
+                name=" & ".join(names) + ".Field",
+                id=g[0].id,
+                data=[
+                    PKDict(x.data[0], vectors=PKDict(x.data[0].vectors, range=c))
+                    for x in g
+                ],
+                bounds=numpy.stack(
+                    (b[:, :, 0].min(axis=0), b[:, :, 1].max(axis=0)), axis=1
                 )
-            self.model_data = self.mgr.vector_field_to_data(
-                g_name, self.solve_results, radia_tk.FIELD_UNITS[f_type]
+                .ravel()
+                .tolist(),
             )
+            t = " & ".join(names)
+        self._set_scene(d)
+        self.title = "{} ({} {})".format(t, f_type, mode)
+        return r
 
-        self.vtk_viewer.set_data(self.model_data)
-        self._refresh()
-        return self
+    def add_field_path(self, points):
+        """Appends points where the field is evaluated, for paths without
+        controls of their own (see field_paths.arc, helix and polyline)
+
+        Args:
+            points (ndarray): (N, 3) positions
+        """
+        self._append_field_points(points)
+        self._display_appended()
+
+    def export(self, f, fmt=None):
+        """Writes the displayed field map, or magnetization, to a file that
+        loads without radia (see field_export.load()). The Export button
+        downloads the same data as NPZ
+
+        Args:
+            f (str or file): path or file-like object; .h5 or .hdf5 for HDF5
+            fmt (str, optional): one of field_export.FORMATS
+        Raises:
+            ValueError: if no field is displayed
+        """
+        if self.solve_results is None or self._rendered_view is None:
+            raise ValueError("No field to export")
+        # what is displayed, which the controls may no longer match
+        g_name, _, f_type = self._rendered_view[:3]
+        field_export.save(
+            f,
+            PKDict(
+                self.mgr.export_metadata(g_name, f_type),
+                points=self.solve_results[:, 0],
+                field=self.solve_results[:, 1],
+            ),
+            fmt=fmt,
+        )
+
+    def get_vector_elements(self, index):
+        """Values drawn as one vector: the magnetization of the elements, when
+        M has been aggregated to fit field_render_budget (see
+        mag_aggregation), or the field at one point of a strided field
+
+        Args:
+            index (int): position of the vector in the displayed field
+        Returns:
+            ndarray: (n, 2, 3) [center, M] or [point, field] pairs from
+            get_result()
+        """
+        if self._vector_members is not None:
+            return self.solve_results[self._vector_members == index]
+        if self._vector_indices is not None:
+            index = self._vector_indices[index]
+        return self.solve_results[index : index + 1]
 
     def get_field_points(self):
         """
         Returns:
-            list: the points where the field is being evaluated, or None
-            if the view type is 'Objects' or the field type is 'M'.
-            The list is flattened (x0, y0, y1,...)
+            ndarray: the points where the field is being evaluated.
+            The array is flattened (x0, y0, z0, x1,...)
             to use as input to Radia.Fld()
         """
-        try:
-            # flatten
-            return [item for sublist in self.current_field_points for item in sublist]
-        except TypeError:
-            # already flattened, as from a file
-            return self.current_field_points
+        return self.current_field_points.points.ravel()
+
+    def show_result(self, result):
+        """Displays a result of RadiaGeomMgr.run_batch() as it was computed,
+        without calling radia for the field
+
+        Args:
+            result (dict): one run_batch() result, for a geometry added to
+                this viewer
+        """
+        g_name, f_type = result["name"], result["f_type"]
+        self.current_geom = g_name
+        self.solve_results = numpy.stack((result["points"], result["field"]), axis=1)
+        # the result may be of a solved copy of the geometry, so points added
+        # later are not evaluated on the manager's geometry and appended
+        self._field_state = None
+        if f_type in radia_tk.POINT_FIELD_TYPES:
+            self.current_field_points.assign(result["points"])
+            self._field_points_shape = None
+        d = self.mgr.vector_field_to_data(
+            g_name,
+            self._render_vectors(g_name, f_type, self.solve_results),
+            radia_tk.FIELD_UNITS[f_type],
+        )
+        self._rendered_view = self._get_view_state(g_name, VIEW_TYPE_FIELD, f_type)
+        # the render of the control changes finds this view current
+        with self._hold_render():
+            self.geom_list.value = g_name
+            self.view_type_list.value = VIEW_TYPE_FIELD
+            self.field_type_list.value = f_type
+        self._update_layout()
+        self._update_actions()
+        self._set_scene(d)
+
+    def set_solve_params(self, params):
+        """Sets the solve controls, for instance to the best run of a sweep
+        (see radia_tk.sweep_best())
+
+        Args:
+            params (dict): prec, max_iter and method
+        """
+        self.solve_prec.value = params["prec"]
+        self.solve_max_iter.value = params["max_iter"]
+        self.solve_method.value = params["method"]
+
+    def show_object_detail(self, index):
+        """Draws one object of the current geometry at full detail, when the
+        geometry has been reduced to fit geom_render_budget
+
+        Args:
+            index (int): position of the object in the geometry's data, as
+                picked in the viewer
+        """
+        d = list(self.model_data.data)
+        d[index] = self.mgr.get_geom_object_data(self.current_geom, index)
+        self.model_data = PKDict(self.model_data, data=d)
+        self._set_viewer_data()
+
+    def clear_stats(self):
+        self._stats.clear()
+
+    @property
+    def stats(self):
+        """Timings of the most recent stages of display() and solves, oldest
+        first, when stats_enabled is set. Suitable for pandas.DataFrame()
+
+        Returns:
+            list: dicts of call (number of the display() call, or of the
+            one before a solve), stage
+            ("geometry", "field", "vectors", "send" or "solve"), start (epoch
+            seconds), seconds, bytes (sent to the browser) and, depending on
+            the stage, points, vertices or iterations
+        """
+        return [dict(r) for r in self._stats]
+
+    def render_stats(self):
+        """
+        Returns:
+            PKDict: number of renders requested by the controls, number
+            executed, and number executed per stage (see RENDER_STAGES)
+        """
+        return PKDict(self._render_stats)
 
     def get_result(self):
         """
@@ -193,8 +522,26 @@ class RadiaViewer(ipywidgets.VBox):
             list: the field points and the value of the field thereat.
             (((x0, y0, z0), (fx0, fy0, fz0)),...)
         """
+        if isinstance(self.solve_results, numpy.ndarray):
+            return self.solve_results.tolist()
         return self.solve_results
 
+    def load_field_points(self, f):
+        """Replaces the field points with those in a file, read by the kernel
+        rather than the browser. Use this for large files
+
+        Args:
+            f (str or file): path or file-like object of a .npy file, which is
+                memory mapped, or text with comma and/or whitespace separated
+                coordinates (x0, y0, z0, x1,...)
+        Raises:
+            ValueError: if the file is not numeric or the number of coordinates
+                is not a multiple of 3
+        """
+        self.current_field_points.assign(field_paths.load(f))
+        self._field_points_shape = None
+        self.display()
+
     def rsdbg(self, msg):
         # send a message to the front end to print to js console
         self.send({"type": "debug", "msg": "KERNEL: " + msg})
@@ -209,6 +556,34 @@ class RadiaViewer(ipywidgets.VBox):
 
     def __init__(self, mgr=None):
         self.model_data = {}
+        self.current_field_points = field_paths.PointArray()
+        # what the field values in solve_results were computed for
+        self._field_state = None
+        # set when display() sent the field vectors a chunk at a time
+        self._field_streamed = False
+        # set when the field points are a single grid or plane
+        self._field_points_shape = None
+        self._pending_display = None
+        self._render_handle = None
+        # set while controls are changed together, see _hold_render()
+        self._render_held = False
+        self._render_pending = set()
+        self._render_stats = PKDict(
+            {k: 0 for k in ["executed", "requested"] + RENDER_STAGES}
+        )
+        # the layout and view last shown by display()
+        self._rendered_layout = None
+        self._rendered_view = None
+        self._sent_bytes = 0
+        self._solve_cancel = threading.Event()
+        self._stats = collections.deque(maxlen=STATS_SIZE)
+        self._stats_call = 0
+        self._solve_job = None
+        # the position in solve_results of each displayed vector of a
+        # strided field
+        self._vector_indices = None
+        # the displayed vector of each element of an aggregated magnetization
+        self._vector_members = None
         self.mgr = radia_tk.RadiaGeomMgr() if mgr is None else mgr
         self.vtk_viewer = vtk_viewer.Viewer()
 
@@ -253,8 +628,8 @@ class RadiaViewer(ipywidgets.VBox):
             [10, 0, 0], {"width": "64px"}
         )
         line_end_grp = _label_grp(line_end_point_coords_grp, "End")
-        self.path_num_pts = ipywidgets.IntText(
-            value=10, min=2, max=100, step=1, layout={"width": "48px"}
+        self.path_num_pts = ipywidgets.BoundedIntText(
+            value=10, min=2, max=10000000, step=1, layout={"width": "64px"}
         )
 
         num_pts_grp = _label_grp(self.path_num_pts, "Num Points")
@@ -308,6 +683,46 @@ class RadiaViewer(ipywidgets.VBox):
             layout={"padding": "0 6px 0 0"},
         )
 
+        self.grid_min_flds, grid_min_coords_grp = _coord_grp(
+            [-10, -10, -10], {"width": "64px"}
+        )
+        grid_min_grp = _label_grp(grid_min_coords_grp, "Min")
+        self.grid_max_flds, grid_max_coords_grp = _coord_grp(
+            [10, 10, 10], {"width": "64px"}
+        )
+        grid_max_grp = _label_grp(grid_max_coords_grp, "Max")
+        self.grid_num_pts_flds, grid_num_pts_grp = _count_grp(
+            [11, 11, 11], ["nx", "ny", "nz"]
+        )
+        self.grid_grp = ipywidgets.HBox(
+            [grid_min_grp, grid_max_grp, grid_num_pts_grp, self.new_field_point_btn],
+            layout={"padding": "0 6px 0 0"},
+        )
+
+        self.plane_origin_flds, plane_origin_coords_grp = _coord_grp(
+            [-10, -10, 0], {"width": "64px"}
+        )
+        plane_origin_grp = _label_grp(plane_origin_coords_grp, "Origin")
+        self.plane_u_flds, plane_u_coords_grp = _coord_grp(
+            [20, 0, 0], {"width": "64px"}
+        )
+        plane_u_grp = _label_grp(plane_u_coords_grp, "U")
+        self.plane_v_flds, plane_v_coords_grp = _coord_grp(
+            [0, 20, 0], {"width": "64px"}
+        )
+        plane_v_grp = _label_grp(plane_v_coords_grp, "V")
+        self.plane_num_pts_flds, plane_num_pts_grp = _count_grp([21, 21], ["nu", "nv"])
+        self.plane_grp = ipywidgets.HBox(
+            [
+                plane_origin_grp,
+                plane_u_grp,
+                plane_v_grp,
+                plane_num_pts_grp,
+                self.new_field_point_btn,
+            ],
+            layout={"padding": "0 6px 0 0"},
+        )
+
         self.geom_list = ipywidgets.Dropdown(
             layout={"width": "max-content"}, options=[n for n in self.mgr.get_geoms()]
         )
@@ -339,6 +754,8 @@ class RadiaViewer(ipywidgets.VBox):
             self._add_field_line,
             self._add_field_circle,
             self._add_field_file,
+            self._add_field_grid,
+            self._add_field_plane,
         ]
 
         self.vector_props_grp = ipywidgets.HBox([field_map_grp, vector_scaling_grp])
@@ -351,6 +768,8 @@ class RadiaViewer(ipywidgets.VBox):
                 self.circle_grp,
                 self.new_field_point_grp,
                 self.pt_file_grp,
+                self.grid_grp,
+                self.plane_grp,
             ]
         )
 
@@ -398,18 +817,24 @@ class RadiaViewer(ipywidgets.VBox):
         )
         self.solve_spinner.layout.display = "none"
 
+        self.solve_cancel_btn = ipywidgets.Button(
+            description="Cancel",
+            layout={"width": "fit-content"},
+        )
+        self.solve_cancel_btn.on_click(self._cancel_solve)
+        self.solve_cancel_btn.layout.display = "none"
+
         self.solve_res_label = ipywidgets.Label()
 
-        # self.export_btn = ipywidgets.Button(
-        #    description='Export',
-        #    layout={'width': 'fit-content'},
-        # )
-        # self.export_btn.on_click(self._export)
+        self.export_btn = ipywidgets.Button(
+            description="Export",
+            layout={"width": "fit-content"},
+        )
+        self.export_btn.on_click(self._export)
 
-        # self.export_link = ipywidgets.HTML(
-        #    value='<a href="#" download="xxx">Export</a>'
-        # )
-        # self.export_link.add_class('radia-file-output')
+        # the front end fills in the file
+        self.export_link = ipywidgets.HTML(value='<a href="#" download=""></a>')
+        self.export_link.add_class("radia-file-output")
 
         self.reset_btn = ipywidgets.Button(
             description="Reset",
@@ -424,9 +849,10 @@ class RadiaViewer(ipywidgets.VBox):
                 solve_method_grp,
                 self.solve_btn,
                 self.solve_spinner,
+                self.solve_cancel_btn,
                 self.solve_res_label,
-                # self.export_btn,
-                # self.export_link
+                self.export_btn,
+                self.export_link,
             ],
             layout={"padding": "3px 0px 3px 0px"},
         )
@@ -459,72 +885,81 @@ class RadiaViewer(ipywidgets.VBox):
             # self._do_raise(ValueError('Invalid file data {}'.format(self.file_data)))
             self.rserr("Invalid file data {}".format(self.file_data))
             return
-        self.current_field_points = self.file_data
+        self.current_field_points.clear()
+        self._append_field_points(self.file_data)
         self.display()
 
+    def _add_field_grid(self, b):
+        shape = [self.grid_num_pts_flds[f].value for f in self.grid_num_pts_flds]
+        self._append_field_points(
+            field_paths.grid(
+                [self.grid_min_flds[f].value for f in self.grid_min_flds],
+                [self.grid_max_flds[f].value for f in self.grid_max_flds],
+                shape,
+            ),
+            shape=shape,
+        )
+        self._display_appended()
+
+    def _add_field_plane(self, b):
+        shape = [self.plane_num_pts_flds[f].value for f in self.plane_num_pts_flds]
+        self._append_field_points(
+            field_paths.plane(
+                [self.plane_origin_flds[f].value for f in self.plane_origin_flds],
+                [self.plane_u_flds[f].value for f in self.plane_u_flds],
+                [self.plane_v_flds[f].value for f in self.plane_v_flds],
+                shape,
+            ),
+            shape=shape,
+        )
+        self._display_appended()
+
     def _add_field_point(self, b):
         new_pt = [self.new_field_pt_flds[f].value for f in self.new_field_pt_flds]
-        self.current_field_points.append(new_pt)
-        self.display()
+        self._append_field_points([new_pt])
+        self._display_appended()
 
     def _add_field_line(self, b):
-        p1 = [self.line_begin_pt_flds[f].value for f in self.line_begin_pt_flds]
-        p2 = [self.line_end_pt_flds[f].value for f in self.line_end_pt_flds]
-        self.current_field_points.append(p1)
-        n = self.path_num_pts.value - 1
-        for i in range(1, n):
-            self.current_field_points.append(
-                [p1[j] + i * (p2[j] - p1[j]) / n for j in range(len(p1))]
+        self._append_field_points(
+            field_paths.line(
+                [self.line_begin_pt_flds[f].value for f in self.line_begin_pt_flds],
+                [self.line_end_pt_flds[f].value for f in self.line_end_pt_flds],
+                self.path_num_pts.value,
             )
-        self.current_field_points.append(p2)
-        self.display()
+        )
+        self._display_appended()
 
     def _add_field_circle(self, b):
-        ctr = [self.circle_ctr_flds[f].value for f in self.circle_ctr_flds]
-        r = float(self.circle_radius.value)
-        # theta is a rotation about the x-axis
-        th = float(self.circle_theta.value)
-        # phi is a rotation about the z-axis
-        phi = float(self.circle_phi.value)
-        # self.rsdbg('adding circle at {} rad {} th {} phi {} ({})'.format(ctr, r, th, phi, self.path_num_pts.value))
-        n = self.path_num_pts.value
-        dpsi = 2.0 * math.pi / n
-        # psi is the angle in the circle's plane
-        for i in range(0, n):
-            psi = i * dpsi
-            # initial position of the point...
-            # a = [r * math.sin(psi), r * math.cos(psi), 0]
-            # ...rotate around x axis
-            # a' = [
-            #    a[0],
-            #    a[1] * math.cos(th) - a[2] * math.sin(th),
-            #    a[1] * math.sin(th) + a[2] * math.cos(th),
-            # ]
-            # ...rotate around z axis
-            # a'' = [
-            #    aa[0] * math.cos(phi) - aa[1] * math.cos(th),
-            #    aa[0] * math.sin(phi) + aa[1] * math.cos(phi),
-            #    aa[2]
-            # ]
-            # ...translate to final position
-            # a''' = [
-            #    ctr[0] + aaa[0],
-            #    ctr[1] + aaa[1],
-            #    ctr[2] + aaa[2],
-            # ]
-            # final position:
-            self.current_field_points.append(
-                [
-                    r * math.sin(psi) * math.cos(phi)
-                    - r * math.cos(psi) * math.cos(th) * math.sin(phi)
-                    + ctr[0],
-                    r * math.sin(psi) * math.sin(phi)
-                    - r * math.cos(psi) * math.cos(th) * math.cos(phi)
-                    + ctr[1],
-                    r * math.cos(psi) * math.sin(th) + ctr[2],
-                ]
+        # theta is a rotation about the x-axis, phi is a rotation about the z-axis
+        self._append_field_points(
+            field_paths.circle(
+                [self.circle_ctr_flds[f].value for f in self.circle_ctr_flds],
+                float(self.circle_radius.value),
+                float(self.circle_theta.value),
+                float(self.circle_phi.value),
+                self.path_num_pts.value,
             )
-        self.display()
+        )
+        self._display_appended()
+
+    def _append_field_points(self, points, shape=None):
+        # shape is only kept when the points are the whole path
+        self._field_points_shape = None if len(self.current_field_points) else shape
+        self.current_field_points.append(points)
+
+    def _append_vectors(self, vectors):
+        # keep the kernel's copy of the displayed vectors in step with the
+        # front end, without syncing the whole model
+        v = self.model_data.data[0].vectors
+        for k in VECTOR_ARRAYS:
+            v[k] = numpy.concatenate((v[k], vectors[k]))
+        v.range = [min(v.range[0], vectors.range[0]), max(v.range[1], vectors.range[1])]
+        self._send_vectors(vectors, append=True)
+
+    def _cancel_solve(self, b):
+        # the solve stops at the end of its current chunk of iterations
+        self._solve_cancel.set()
+        self.solve_cancel_btn.disabled = True
 
     def _data_loaded(self, d):
         # other stuff?  validate here?
@@ -543,24 +978,322 @@ class RadiaViewer(ipywidgets.VBox):
         for c in self.controls:
             c.disabled = False
 
-    # def _export(self, b):
-    #    self.rsdbg('EXPORT {}'.format(self.solve_results))
-    #    self.send({'type': 'download'})
+    def _export(self, b):
+        if self.solve_results is None or self._rendered_view is None:
+            self.rserr("No field to export")
+            return
+        f = io.BytesIO()
+        self.export(f)
+        g_name, _, f_type = self._rendered_view[:3]
+        self.send(
+            {
+                "type": "download",
+                "filename": "{}_{}.npz".format(g_name, f_type),
+            },
+            buffers=[f.getbuffer()],
+        )
 
     def _refresh(self):
         self._set_title()
         self.send({"type": "refresh"})
 
+    def _display_appended(self):
+        # evaluates only the points added since the last display, if the
+        # geometry, field and solution are unchanged
+        n = 0 if self.solve_results is None else len(self.solve_results)
+        if (
+            self._solve_job is not None
+            or self._field_state is None
+            or self._field_state
+            != self._get_view_state(
+                self.current_geom, self.view_type_list.value, self.field_type_list.value
+            )
+            or len(self.current_field_points) <= n
+            # the points may have been cleared or replaced since
+            or not numpy.array_equal(
+                self.solve_results[:, 0], self.current_field_points.points[:n]
+            )
+        ):
+            self.display()
+            return
+        g_name, f_type = self.current_geom, self.field_type_list.value
+        u = radia_tk.FIELD_UNITS[f_type]
+        p = self.current_field_points.points[n:]
+        # the displayed subset changes once over budget
+        send = n + len(p) <= self.field_render_budget
+        res = numpy.empty((n + len(p), 2, 3))
+        res[:n] = self.solve_results
+        for i, b in self.mgr.iter_field(
+            g_name, f_type, p, chunk_size=self.field_chunk_size
+        ):
+            res[n + i : n + i + len(b)] = b
+            if send:
+                self._append_vectors(radia_tk.vectors_to_data(b, u))
+        self.solve_results = res
+        if not send:
+            self._set_scene(
+                self.mgr.vector_field_to_data(
+                    g_name, self._render_subset(res, f_type), u
+                )
+            )
+
+    def _display_vectors(self, g_name, f_type):
+        # display() of another field of the geometry shown, with the same
+        # layout: the output and controls are left as they are
+        self.solve_results = None
+        self._field_state = None
+        self._field_streamed = False
+        self._stats_call += 1
+        d = self._field_to_data(g_name, f_type)
+        with self._timed("send"):
+            self._rendered_view = self._get_view_state(g_name, VIEW_TYPE_FIELD, f_type)
+            if d is not None:
+                self._set_scene(d)
+
+    def _field_to_data(self, g_name, f_type):
+        # computes solve_results and returns its vectors, or None if they
+        # were streamed to the viewer
+        with self._timed("field") as r:
+            if f_type == radia_tk.FIELD_TYPE_MAG_M:
+                self.solve_results = self.mgr.get_magnetization_array(g_name)
+            elif f_type in radia_tk.POINT_FIELD_TYPES:
+                self.solve_results = self._get_field(
+                    g_name, f_type, self.get_field_points()
+                )
+                self._field_state = self._get_view_state(
+                    g_name, VIEW_TYPE_FIELD, f_type
+                )
+        if r is not None:
+            r.points = len(self.solve_results)
+        if self._field_streamed:
+            # the viewer already has the vectors, sent as they were computed
+            self._vector_members = None
+            return None
+        with self._timed("vectors") as r:
+            d = self.mgr.vector_field_to_data(
+                g_name,
+                self._render_vectors(g_name, f_type),
+                radia_tk.FIELD_UNITS[f_type],
+            )
+        if r is not None:
+            r.points = len(d.data[0].vectors.magnitudes)
+        return d
+
+    def _get_field(self, g_name, f_type, path):
+        n = len(path) // 3
+        if n <= self.field_chunk_size:
+            return self.mgr.get_field_array(g_name, f_type, path)
+        if self.field_workers > 0:
+            return self.mgr.get_field_parallel(
+                g_name, f_type, path, num_workers=self.field_workers
+            )
+        res = numpy.empty((n, 2, 3))
+        self._vector_indices = self._render_indices(n, f_type)
+        m = None
+        if self._vector_indices is not None:
+            m = numpy.zeros(n, dtype=bool)
+            m[self._vector_indices] = True
+        u = radia_tk.FIELD_UNITS[f_type]
+        for i, b in self.mgr.iter_field(
+            g_name, f_type, path, chunk_size=self.field_chunk_size
+        ):
+            res[i : i + len(b)] = b
+            v = b if m is None else b[m[i : i + len(b)]]
+            if i == 0:
+                self._set_scene(self.mgr.vector_field_to_data(g_name, v, u))
+            elif len(v):
+                self._append_vectors(radia_tk.vectors_to_data(v, u))
+        self._field_streamed = True
+        return res
+
+    def _get_layout_state(self):
+        # the inputs of _update_layout() and _update_actions()
+        return (
+            self.view_type_list.value,
+            self.field_type_list.value in radia_tk.POINT_FIELD_TYPES,
+            self.path_type_list.value,
+        )
+
+    def _get_view_state(self, g_name, v_type, f_type):
+        # the inputs of display() that are not the field points. Generations
+        # count per Radia object, so the object is part of the state: another
+        # geometry added under the same name can be at the same generation
+        return (
+            g_name,
+            v_type,
+            f_type if v_type == VIEW_TYPE_FIELD else None,
+            self.mgr.get_geom(g_name) if g_name else None,
+            self.mgr.get_generation(g_name) if g_name else None,
+        )
+
+    @contextlib.contextmanager
+    def _hold_render(self):
+        # controls changed in the context are rendered together at its end,
+        # even without an event loop
+        self._render_held = True
+        try:
+            yield
+        finally:
+            self._render_held = False
+        if self._render_pending:
+            self._schedule_render()
+
+    def _render_indices(self, n, f_type):
+        # the vectors drawn out of n, or None for all of them
+        if n <= self.field_render_budget:
+            return None
+        return field_paths.stride_indices(
+            n,
+            self.field_render_budget,
+            self._field_points_shape if f_type in radia_tk.POINT_FIELD_TYPES else None,
+        )
+
+    def _render_subset(self, pv_arr, f_type):
+        a = numpy.reshape(numpy.asarray(pv_arr, dtype=float), (-1, 2, 3))
+        i = self._render_indices(len(a), f_type)
+        # the positions in pv_arr of the vectors drawn, see get_vector_elements()
+        self._vector_indices = i
+        return a if i is None else a[i]
+
+    def _render_vectors(self, g_name, f_type, pv_arr=None):
+        # the vectors drawn for solve_results, which is the magnetization of
+        # the geometry as it is now unless pv_arr is given
+        self._vector_indices = None
+        self._vector_members = None
+        if f_type != radia_tk.FIELD_TYPE_MAG_M:
+            return self._render_subset(self.solve_results, f_type)
+        if pv_arr is None:
+            v = self.mgr.get_magnetization_view(
+                g_name,
+                self.mag_aggregation,
+                self.field_render_budget,
+                voxel_size=self.mag_voxel_size or None,
+            )
+        else:
+            v = mag_lod.reduce(
+                pv_arr,
+                self.mag_aggregation,
+                self.field_render_budget,
+                voxel_size=self.mag_voxel_size or None,
+            )
+        # an explicit voxel size may exceed the budget, in which case the
+        # members are renumbered to the vectors drawn
+        i = self._render_indices(len(v.vectors), f_type)
+        if i is None:
+            self._vector_members = v.members
+            return v.vectors
+        r = numpy.full(len(v.vectors) + 1, -1, dtype=numpy.int64)
+        r[i] = numpy.arange(len(i))
+        # -1 (not drawn) maps to the last entry, which is -1
+        self._vector_members = r[v.members]
+        return v.vectors[i]
+
     def _remove_field_point(self, p_idx):
         pass
 
     def _reset(self):
         self.rsdbg("RESET")
 
+    def _record_stats(self, record):
+        self._stats.append(record)
+        if self.stats_debug:
+            self.rsdbg("stats {}".format(pkjson.dump_str(record)))
+
+    @contextlib.contextmanager
+    def _record_stage(self, stage):
+        r = PKDict(call=self._stats_call, stage=stage, start=time.time())
+        b = self._sent_bytes
+        t = time.perf_counter()
+        try:
+            yield r
+        finally:
+            r.seconds = time.perf_counter() - t
+            r.bytes = self._sent_bytes - b
+            self._record_stats(r)
+
+    def _render(self):
+        # one render for all the changes requested since the last one
+        self._render_handle = None
+        p = self._render_pending
+        self._render_pending = set()
+        self._render_stats.executed += 1
+        if RENDER_STAGE_COLOR_MAP in p:
+            self._render_stats[RENDER_STAGE_COLOR_MAP] += 1
+            self.vtk_viewer.content.vector_color_map_name = self.field_color_map_name
+        if RENDER_STAGE_LAYOUT not in p:
+            return
+        v = self._get_view_state(
+            self.current_geom, self.view_type_list.value, self.field_type_list.value
+        )
+        if v == self._rendered_view:
+            # only the path controls changed
+            self._render_stats[RENDER_STAGE_LAYOUT] += 1
+            self._update_layout()
+            self._update_actions()
+            self._rendered_layout = self._get_layout_state()
+            return
+        if (
+            self._solve_job is None
+            and self._rendered_view is not None
+            and v[:2] == self._rendered_view[:2]
+            and v[1] == VIEW_TYPE_FIELD
+            and self._get_layout_state() == self._rendered_layout
+        ):
+            # another field, or version, of the geometry shown
+            self._render_stats[RENDER_STAGE_VECTORS] += 1
+            self._display_vectors(v[0], v[2])
+            return
+        self._render_stats[RENDER_STAGE_GEOMETRY] += 1
+        self.display(self.current_geom)
+
+    def _request_render(self, stage):
+        # renders once per event loop iteration, however many controls changed
+        self._render_stats.requested += 1
+        self._render_pending.add(stage)
+        self._schedule_render()
+
+    def _schedule_render(self):
+        if self._render_handle is not None or self._render_held:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # no loop to defer to
+            self._render()
+            return
+        self._render_handle = loop.call_soon(self._render)
+
     def _set_current_geom(self, d):
-        g_name = d["new"]
-        self.current_geom = g_name
-        self.display(g_name)
+        self.current_geom = d["new"]
+        self._request_render(RENDER_STAGE_LAYOUT)
+
+    def _send_vectors(self, vectors, append=False):
+        # vectors go as binary buffers in the order of VECTOR_ARRAYS, or as
+        # lists in the message without binary_transport. Replaced vectors may
+        # be of a new version of the geometry, so they carry its bounds and
+        # outline key
+        b = [
+            numpy.ascontiguousarray(vectors[k], dtype=numpy.float32)
+            for k in VECTOR_ARRAYS
+        ]
+        m = PKDict(
+            type="vectors",
+            append=append,
+            range=vectors.range,
+            units=vectors.units,
+        )
+        if not append:
+            m.update(bounds=self.model_data.bounds, outline=self.model_data.outline)
+        if not self.binary_transport:
+            m.update(zip(VECTOR_ARRAYS, (x.tolist() for x in b)))
+            b = []
+        if self.stats_enabled:
+            self._sent_bytes += (
+                sum(x.nbytes for x in b)
+                if b
+                else radia_tk.data_nbytes([m[k] for k in VECTOR_ARRAYS])
+            )
+        self.send(m, buffers=b)
 
     def _set_client_props(self, d):
         self.client_props = d["new"]
@@ -570,7 +1303,37 @@ class RadiaViewer(ipywidgets.VBox):
 
     def _set_field_color_map(self, d):
         self.field_color_map_name = d["new"]
-        self.vtk_viewer.content.vector_color_map_name = self.field_color_map_name
+        self._request_render(RENDER_STAGE_COLOR_MAP)
+
+    def _set_outline(self, model_data):
+        if self.outline.get("key") == model_data.outline:
+            return
+        self.outline = PKDict(
+            key=model_data.outline, data=[PKDict(lines=model_data.data[0].lines)]
+        )
+
+    def _set_viewer_data(self):
+        # model_data is synced by its trait; the front end hands it to the VTK
+        # view with the outline
+        self._refresh()
+
+    def _set_scene(self, model_data):
+        # sends the smallest change from the scene in the front end. Vectors
+        # of the same geometry replace those displayed there; anything else
+        # is a new scene
+        m = self.model_data
+        if model_data.get("outline"):
+            self._set_outline(model_data)
+        if not (
+            m.get("outline") and model_data.get("outline") and m["id"] == model_data.id
+        ):
+            self.model_data = model_data
+            self._set_viewer_data()
+            return
+        # the kernel's copy is updated in place, so the model is not synced
+        m.update(model_data)
+        self._set_title()
+        self._send_vectors(m.data[0].vectors)
 
     def _set_title(self):
         f = (
@@ -583,34 +1346,98 @@ class RadiaViewer(ipywidgets.VBox):
     def _set_vector_scaling(self, d):
         self.vector_scaling = d["new"]
 
+    def _show_solve_time(self, job, start):
+        if job is not self._solve_job:
+            return
+        d = datetime.datetime.now() - start
+        self.solve_res_label.value = "Solving ({}s)".format(d.seconds)
+        asyncio.get_event_loop().call_later(0.5, self._show_solve_time, job, start)
+
     def _solve(self, b):
         self._disable_controls()
         self.solve_res_label.value = ""
         self.solve_spinner.layout.display = None
         start = datetime.datetime.now()
-        # move all radia refs to tk?
-        try:
-            res = radia.Solve(
-                self.mgr.get_geom(self.current_geom),
-                self.solve_prec.value,
-                self.solve_max_iter.value,
-                self.solve_method.value,
-            )
-        except RuntimeError as ex:
+        self._solve_cancel.clear()
+        args = (
+            self.current_geom,
+            self.solve_prec.value,
+            self.solve_max_iter.value,
+            self.solve_method.value,
+        )
+        if not self.solve_async:
+            try:
+                res = self.mgr.solve(*args)
+            except Exception as ex:
+                self._solve_done(start, ex=ex)
+                return
+            self._solve_done(start, res=res)
+            return
+        loop = asyncio.get_event_loop()
+        self.solve_cancel_btn.disabled = False
+        self.solve_cancel_btn.layout.display = None
+        self._solve_job = self.mgr.solve_async(*args, cancel=self._solve_cancel)
+        # the job finishes on the worker thread - update the widgets from the kernel's loop
+        self._solve_job.add_done_callback(
+            lambda f: loop.call_soon_threadsafe(self._solve_finished, f, start)
+        )
+        self._show_solve_time(self._solve_job, start)
+
+    def _solve_done(self, start, res=None, ex=None):
+        # the controls are restored whatever the outcome
+        self.solve_spinner.layout.display = "none"
+        self.solve_cancel_btn.layout.display = "none"
+        self._enable_controls()
+        a = self._pending_display
+        self._pending_display = None
+        if ex is not None:
+            self.solve_res_label.value = "Solve failed"
             self.rserr("Solve failed: {}".format(ex))
             # self._do_raise(ex)
+            # the geometry is unchanged, but the display requested during
+            # the solve is still due
+            if a is not None:
+                self.display(*a)
             return
-        finally:
-            self.solve_spinner.layout.display = "none"
-            self._enable_controls()
-        self.display()
         d = datetime.datetime.now() - start
+        if self.stats_enabled:
+            self._record_stats(
+                PKDict(
+                    call=self._stats_call,
+                    stage="solve",
+                    start=start.timestamp(),
+                    seconds=d.total_seconds(),
+                    bytes=0,
+                    iterations=int(res[3]),
+                )
+            )
+        self.display(*(a or ()))
         self.solve_res_label.value = (
-            "Done {} steps ({}.{:06}s): Max |M| {:.4}A/m; Max |H| {:.4}A/m".format(
-                int(res[3]), d.seconds, d.microseconds, res[1], res[2]
+            "{} {} steps ({}.{:06}s): Max |M| {:.4}A/m; Max |H| {:.4}A/m".format(
+                "Cancelled after" if self._solve_cancel.is_set() else "Done",
+                int(res[3]),
+                d.seconds,
+                d.microseconds,
+                res[1],
+                res[2],
             )
         )
 
+    def _solve_finished(self, job, start):
+        self._solve_job = None
+        try:
+            res = job.result()
+        except Exception as ex:
+            self._solve_done(start, ex=ex)
+            return
+        self._solve_done(start, res=res)
+
+    def _timed(self, stage):
+        # context for timing a stage, yielding its record, or None if disabled
+        if not self.stats_enabled:
+            return _NO_STATS
+        return self._record_stage(stage)
+
     # show/hide/enable/disable controls based on current state
     # TODO(mvk): getting unwieldy, time to refactor
     def _update_layout(self):
@@ -650,6 +1477,18 @@ class RadiaViewer(ipywidgets.VBox):
             and self.path_type_list.value == PATH_TYPE_FILE
             else "none"
         )
+        self.grid_grp.layout.display = (
+            None
+            if self.field_type_list.value in radia_tk.POINT_FIELD_TYPES
+            and self.path_type_list.value == PATH_TYPE_GRID
+            else "none"
+        )
+        self.plane_grp.layout.display = (
+            None
+            if self.field_type_list.value in radia_tk.POINT_FIELD_TYPES
+            and self.path_type_list.value == PATH_TYPE_PLANE
+            else "none"
+        )
 
     # change control behavior based on current state
     def _update_actions(self):
@@ -665,11 +1504,17 @@ class RadiaViewer(ipywidgets.VBox):
                 self.new_field_point_btn.on_click(self._add_field_point)
             if self.path_type_list.value == PATH_TYPE_FILE:
                 self.new_field_point_btn.on_click(self._add_field_file)
+            if self.path_type_list.value == PATH_TYPE_GRID:
+                self.new_field_point_btn.on_click(self._add_field_grid)
+            if self.path_type_list.value == PATH_TYPE_PLANE:
+                self.new_field_point_btn.on_click(self._add_field_plane)
 
     def _update_viewer(self, d):
-        self.display(self.current_geom)
+        self._request_render(RENDER_STAGE_LAYOUT)
 
     def _upload(self, b):
         self.current_field_points.clear()
+        # the field shown is no longer that of the points
+        self._field_state = None
         # self._disable_controls()
         self.send({"type": "upload"})
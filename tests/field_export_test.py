@@ -0,0 +1,67 @@
+"""test field_export"""
+
+
+def _metadata():
+    from pykern.pkcollections import PKDict
+
+    return PKDict(
+        name="g",
+        f_type="B",
+        units="T",
+        bounds=[-1.0, 1.0, -2.0, 2.0, -3.0, 3.0],
+        solve=PKDict(prec=0.001, max_iter=100, method=0, result=[1e-4, 1, 2, 5]),
+    )
+
+
+def test_npz_round_trip():
+    from jupyter_rs_radia import field_export
+    from pykern import pkunit
+    import numpy
+
+    d = pkunit.empty_work_dir()
+    a = numpy.random.default_rng(0).random((10, 2, 3))
+    p = d.join("map.npz")
+    with field_export.Writer(str(p), len(a), _metadata()) as w:
+        # blocks of uneven sizes
+        for i, j in ((0, 3), (3, 4), (4, 10)):
+            w.write(a[i:j])
+    r = field_export.load(str(p))
+    pkunit.pkok(numpy.array_equal(a[:, 0], r.points), "points={}", r.points)
+    pkunit.pkok(numpy.array_equal(a[:, 1], r.field), "field={}", r.field)
+    for k, v in _metadata().items():
+        pkunit.pkeq(v, r[k])
+    # plain numpy reads it too
+    with numpy.load(str(p)) as n:
+        pkunit.pkok(numpy.array_equal(a[:, 1], n["field"]), "numpy.load={}", n)
+    # save writes the same from arrays in memory
+    field_export.save(
+        str(d.join("saved.npz")),
+        dict(_metadata(), points=a[:, 0], field=a[:, 1]),
+    )
+    r = field_export.load(str(d.join("saved.npz")))
+    pkunit.pkok(numpy.array_equal(a[:, 1], r.field), "field={}", r.field)
+
+
+def test_abort():
+    from jupyter_rs_radia import field_export
+    from pykern import pkunit
+    import numpy
+
+    d = pkunit.empty_work_dir()
+    p = d.join("map.npz")
+    with pkunit.pkexcept(RuntimeError):
+        with field_export.Writer(str(p), 10, _metadata()) as w:
+            w.write(numpy.zeros((4, 2, 3)))
+            raise RuntimeError("stopped")
+    pkunit.pkok(not p.exists(), "partial file after an exception")
+    # too few points
+    w = field_export.Writer(str(p), 10, _metadata())
+    w.write(numpy.zeros((4, 2, 3)))
+    with pkunit.pkexcept(ValueError):
+        w.close()
+    pkunit.pkok(not p.exists(), "partial file after close")
+    with field_export.Writer(str(p), 1, _metadata()) as w:
+        with pkunit.pkexcept(ValueError):
+            w.write(numpy.zeros((2, 2, 3)))
+        w.write(numpy.zeros((1, 2, 3)))
+    pkunit.pkok(p.exists(), "complete file removed")
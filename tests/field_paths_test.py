@@ -0,0 +1,103 @@
+"""test field_paths"""
+
+
+def test_point_array_assign():
+    from jupyter_rs_radia import field_paths
+    from pykern import pkunit
+    import numpy
+
+    p = numpy.arange(12.0).reshape(4, 3)
+    c = p.copy()
+    a = field_paths.PointArray()
+    a.assign(p)
+    pkunit.pkeq(4, len(a))
+    # the assigned array is the caller's and must not be reused
+    a.clear()
+    a.append([[-1.0, -2.0, -3.0]])
+    pkunit.pkok(numpy.array_equal(p, c), "assigned array modified: {}", p)
+    pkunit.pkok(numpy.array_equal(a.points, [[-1.0, -2.0, -3.0]]), "{}", a.points)
+    a.assign(p)
+    a.append([[-1.0, -2.0, -3.0]])
+    pkunit.pkok(numpy.array_equal(p, c), "assigned array modified: {}", p)
+    pkunit.pkeq(5, len(a))
+
+
+def test_circle():
+    from jupyter_rs_radia import field_paths
+    from pykern import pkunit
+    import math, numpy
+
+    ctr, r, th, phi, n = [1.0, -2.0, 0.5], 3.0, 0.3, 1.1, 7
+    # the per-point formula field_paths.circle replaced
+    e = []
+    for i in range(n):
+        psi = i * 2.0 * math.pi / n
+        e.append(
+            [
+                r * math.sin(psi) * math.cos(phi)
+                - r * math.cos(psi) * math.cos(th) * math.sin(phi)
+                + ctr[0],
+                r * math.sin(psi) * math.sin(phi)
+                - r * math.cos(psi) * math.cos(th) * math.cos(phi)
+                + ctr[1],
+                r * math.cos(psi) * math.sin(th) + ctr[2],
+            ]
+        )
+    a = field_paths.circle(ctr, r, th, phi, n)
+    pkunit.pkeq((n, 3), a.shape)
+    pkunit.pkok(numpy.allclose(a, e), "circle={} expect={}", a, e)
+
+
+def test_line():
+    from jupyter_rs_radia import field_paths
+    from pykern import pkunit
+    import numpy
+
+    p1, p2, n = [0.0, 1.0, -1.0], [3.0, -2.0, 0.1], 6
+    # the per-point formula field_paths.line replaced
+    e = [p1]
+    for i in range(1, n - 1):
+        e.append([p1[j] + i * (p2[j] - p1[j]) / (n - 1) for j in range(3)])
+    e.append(p2)
+    a = field_paths.line(p1, p2, n)
+    pkunit.pkok(numpy.allclose(a, e), "line={} expect={}", a, e)
+    # the end point is exact
+    pkunit.pkeq(p2, a[-1].tolist())
+
+
+def test_load_chunks():
+    from jupyter_rs_radia import field_paths
+    from pykern import pkunit
+    import io, numpy
+
+    p = numpy.arange(30.0).reshape(10, 3) * 1.25 - 7.5
+    t = "\n".join(", ".join(repr(float(x)) for x in r) for r in p).encode()
+    # numbers split at every possible place across chunks
+    for c in range(1, 12):
+        a = field_paths.load(io.BytesIO(t), chunk_bytes=c)
+        pkunit.pkok(numpy.array_equal(a, p), "chunk_bytes={} points={}", c, a)
+    pkunit.pkeq((0, 3), field_paths.load(io.BytesIO(b" \n")).shape)
+    with pkunit.pkexcept(ValueError):
+        field_paths.load(io.BytesIO(b"1, 2, 3, 4"))
+    with pkunit.pkexcept(ValueError):
+        field_paths.load(io.BytesIO(b"1, 2, x"))
+
+
+def test_stride_indices():
+    from jupyter_rs_radia import field_paths
+    from pykern import pkunit
+    import numpy
+
+    pkunit.pkeq(list(range(5)), field_paths.stride_indices(5, 10).tolist())
+    i = field_paths.stride_indices(100, 30)
+    pkunit.pkok(len(i) <= 30, "too many indices={}", len(i))
+    pkunit.pkeq(0, i[0])
+    pkunit.pkeq(1, len(set(numpy.diff(i))))
+    # a grid stays a grid: the same points along each axis
+    s = (10, 8, 6)
+    i = field_paths.stride_indices(numpy.prod(s), 50, s)
+    pkunit.pkok(len(i) <= 50, "too many indices={}", len(i))
+    g = numpy.stack(numpy.unravel_index(i, s), axis=1)
+    n = [len(numpy.unique(g[:, k])) for k in range(3)]
+    pkunit.pkeq(int(numpy.prod(n)), len(i))
+    pkunit.pkok(numpy.all(numpy.diff(i) > 0), "not sorted={}", i)
@@ -0,0 +1,82 @@
+"""test geom_lod"""
+
+
+def _cube(x, y, z, name):
+    from jupyter_rs_radia import geom_lod
+    from pykern.pkcollections import PKDict
+    import numpy
+
+    return PKDict(
+        geom_lod._box(
+            PKDict(
+                lines=PKDict(
+                    colors=numpy.array([1, 0, 0], dtype=numpy.float32),
+                    lengths=numpy.zeros(0, dtype=numpy.int32),
+                    vertices=numpy.zeros(0, dtype=numpy.float32),
+                ),
+                polygons=PKDict(
+                    colors=numpy.array([0.5, 0.5, 0.5], dtype=numpy.float32),
+                    lengths=numpy.array([2], dtype=numpy.int32),
+                    vertices=numpy.array(
+                        [x, y, z, x + 1, y + 1, z + 1], dtype=numpy.float32
+                    ),
+                ),
+            )
+        ),
+        name=name,
+    )
+
+
+def test_reduce_shared_faces():
+    from jupyter_rs_radia import geom_lod
+    from pykern import pkunit
+    import numpy
+
+    # a and b touch at x = 1; c is apart
+    o = [_cube(0, 0, 0, "a"), _cube(1, 0, 0, "b"), _cube(5, 0, 0, "c")]
+    pkunit.pkeq(18, geom_lod.num_polygons(o))
+    r = geom_lod.reduce(o, 17)
+    pkunit.pkeq(["a", "b", "c"], [x.name for x in r])
+    pkunit.pkeq([5, 5, 6], [len(x.polygons.lengths) for x in r])
+    pkunit.pkeq([5, 5, 6], [len(x.lines.lengths) for x in r])
+    for x in r:
+        v = numpy.reshape(x.polygons.vertices, (-1, 3))
+        pkunit.pkeq(4 * len(x.polygons.lengths), len(v))
+        pkunit.pkeq(3 * len(x.polygons.lengths), len(x.polygons.colors))
+    # the shared face at x = 1 is gone from both
+    for x in r[:2]:
+        v = numpy.reshape(x.polygons.vertices, (-1, 4, 3))
+        pkunit.pkok(
+            not numpy.any(numpy.all(v[:, :, 0] == 1, axis=1)),
+            "{} has the shared face",
+            x.name,
+        )
+    # within the budget, the objects are returned as they are
+    pkunit.pkok(geom_lod.reduce(o, 18) is o, "objects copied within budget")
+
+
+def test_reduce_box():
+    from jupyter_rs_radia import geom_lod
+    from pykern import pkunit
+    from pykern.pkcollections import PKDict
+    import numpy
+
+    # a column of separate cubes as one object, which is drawn as its
+    # bounding box
+    c = [_cube(10, 0, 2 * i, "big") for i in range(100)]
+    b = PKDict(
+        c[0],
+        polygons=PKDict(
+            c[0].polygons,
+            colors=numpy.concatenate([x.polygons.colors for x in c]),
+            lengths=numpy.concatenate([x.polygons.lengths for x in c]),
+            vertices=numpy.concatenate([x.polygons.vertices for x in c]),
+        ),
+    )
+    o = [_cube(0, 0, 0, "a"), b, _cube(5, 0, 0, "c")]
+    r = geom_lod.reduce(o, 100)
+    pkunit.pkeq(["a", "big", "c"], [x.name for x in r])
+    pkunit.pkeq([6, 6, 6], [len(x.polygons.lengths) for x in r])
+    v = numpy.reshape(r[1].polygons.vertices, (-1, 3))
+    pkunit.pkeq([10, 0, 0], v.min(axis=0).tolist())
+    pkunit.pkeq([11, 1, 199], v.max(axis=0).tolist())
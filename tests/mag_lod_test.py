@@ -0,0 +1,52 @@
+"""test mag_lod"""
+
+
+def _elements(n):
+    import numpy
+
+    # centers along a line, with |M| = element number
+    m = numpy.zeros((n, 2, 3))
+    m[:, 0, 0] = numpy.arange(n)
+    m[:, 1, 2] = numpy.arange(n)
+    return m
+
+
+def test_reduce_members():
+    from jupyter_rs_radia import mag_lod
+    from pykern import pkunit
+    import numpy
+
+    m = _elements(100)
+    for a in mag_lod.AGGREGATIONS:
+        r = mag_lod.reduce(m, a, 10, groups=numpy.arange(100) // 20)
+        pkunit.pkok(len(r.vectors) <= 10, "{}: {} vectors", a, len(r.vectors))
+        pkunit.pkeq(len(m), len(r.members))
+        # each drawn vector is the mean of its members
+        for i, v in enumerate(r.vectors):
+            e = m[r.members == i]
+            pkunit.pkok(len(e), "{}: vector {} has no members", a, i)
+            pkunit.pkok(numpy.allclose(e.mean(axis=0), v), "{}: vector {}={}", a, i, v)
+    # one vector per container
+    g = numpy.arange(100) // 20
+    r = mag_lod.reduce(m, mag_lod.AGGREGATION_CONTAINER, 10, groups=g)
+    pkunit.pkeq(g.tolist(), r.members.tolist())
+    # the largest elements, in element order, and -1 for the others
+    r = mag_lod.reduce(m, mag_lod.AGGREGATION_LARGEST, 10)
+    pkunit.pkeq(list(range(90, 100)), r.vectors[:, 1, 2].tolist())
+    pkunit.pkeq([-1] * 90 + list(range(10)), r.members.tolist())
+
+
+def test_reduce_budget():
+    from jupyter_rs_radia import mag_lod
+    from pykern import pkunit
+    import numpy
+
+    m = _elements(5)
+    r = mag_lod.reduce(m, mag_lod.AGGREGATION_VOXEL, 5)
+    pkunit.pkok(numpy.array_equal(m, r.vectors), "vectors={}", r.vectors)
+    pkunit.pkeq(list(range(5)), r.members.tolist())
+    # an explicit voxel size is not bounded by the budget
+    r = mag_lod.reduce(_elements(100), mag_lod.AGGREGATION_VOXEL, 10, voxel_size=5)
+    pkunit.pkeq(20, len(r.vectors))
+    with pkunit.pkexcept(ValueError):
+        mag_lod.reduce(m, "none", 5)